@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# Assigns the games of all of the teams to the fins, so that games that
+# overlap (a doubleheader, a makeup game, or games of two teams at the same
+# time) are recorded on different fins. Each game occupies a fin from the
+# moment it is handed to the fin to warm up until the end of its recording.
+# The games of all of the schedules are merged and swept in order of the start
+# of these windows, with the fins that are in use held in a heap ordered by
+# the time they become free; each game is given a free fin that can receive
+# its station. When all of the fins can receive every station this greedy
+# partitioning of the intervals uses as few fins as possible, so a game is
+# only left out when every fin is in use. The work grows as n log n in the
+# number of games, so whole seasons of several teams are assigned at once.
+#
+# Usage:
+#     allocate.py team=schedule ...
+# Shows the fin assigned to each game and the games that cannot be recorded.
+
+# Imports {{{1
+from fins import fins
+import heapq
+import time
+
+# Windows {{{1
+def window(game, duration=None):
+    """
+    Return the start and end (seconds since the epoch) of the time a fin is
+    occupied by a game. Duration, in hours, is as for record().
+    """
+    from schedule import recordingLength
+    from recorder import WarmUp
+    return (
+        game['start'] - WarmUp,
+        game['start'] + 3600*recordingLength(game, duration)
+    )
+
+# Compatibility {{{1
+def band(station):
+    """
+    Return the band of a station given as sharkctrl arguments ('am' or 'fm').
+    """
+    return station.split()[0].lstrip('-')
+
+def compatible(finName, team, tuned=None, pinned=False):
+    """
+    Return True if the fin can record the games of the team. A fin may be
+    limited to certain bands (by its optional bands field in fins.py), it may
+    be kept tuned to one station (tuned gives the station of each fin that
+    has a pre-roll capture), and if pinned is true the games of a team may
+    only be recorded on the team's own fin.
+    """
+    if pinned and finName != team.fin:
+        return False
+    if band(team.station) not in getattr(fins[finName], 'bands', ('am', 'fm')):
+        return False
+    station = (tuned or {}).get(finName)
+    return station is None or station == team.station
+
+def choose(candidates, team):
+    """
+    Choose the fin for a game from the fins that are free and compatible:
+    the team's own fin if possible, otherwise the first by name.
+    """
+    return min(candidates, key=lambda finName: (finName != team.fin, finName))
+
+# Allocate {{{1
+def allocate(
+    games, finNames=None, tuned=None, busy=None, pinned=False, duration=None
+):
+    """
+    Assign games to fins. Games is a sequence of (key, game, team) triples,
+    where the key identifies the game. FinNames gives the fins to use (all of
+    the fins by default), and busy gives the time at which each fin that is
+    already recording will become free. Returns a dictionary that gives the
+    name of the fin assigned to each key, and a list of the games that could
+    not be assigned, each as a (key, game, team, blockers) tuple, where
+    blockers are the games occupying the compatible fins.
+    """
+    finNames = sorted(finNames or fins)
+    windows = sorted(
+        window(game, duration) + (key, game, team)
+        for key, game, team in games
+    )
+    inUse = [(until, finName) for finName, until in (busy or {}).items()]
+    heapq.heapify(inUse)
+    free = set(finNames) - set(busy or {})
+    occupant = {}
+    assigned = {}
+    conflicts = []
+    for start, end, key, game, team in windows:
+        while inUse and inUse[0][0] <= start:
+            until, finName = heapq.heappop(inUse)
+            free.add(finName)
+            occupant.pop(finName, None)
+        candidates = [
+            finName for finName in free
+            if compatible(finName, team, tuned, pinned)
+        ]
+        if not candidates:
+            conflicts.append((key, game, team, [
+                occupant[finName] for finName in finNames
+                if finName in occupant and
+                compatible(finName, team, tuned, pinned)
+            ]))
+            continue
+        finName = choose(candidates, team)
+        free.remove(finName)
+        heapq.heappush(inUse, (end, finName))
+        occupant[finName] = game
+        assigned[key] = finName
+    return assigned, conflicts
+
+def describeConflict(game, team, blockers):
+    """
+    Return a message that explains why a game cannot be recorded.
+    """
+    reason = (
+        'overlaps %s' % ', '.join(blocker['desc'] for blocker in blockers)
+        if blockers else 'no fin can receive %s' % team.station
+    )
+    return 'Cannot record %s %s (%s): %s.' % (
+        team.name, game['desc'], time.ctime(game['start']), reason
+    )
+
+# Main {{{1
+if __name__ == '__main__':
+    from teams import teams
+    from schedule import readSchedule
+    import argparse
+    import sys
+    clp = argparse.ArgumentParser(description="Assign the games to the fins.")
+    clp.add_argument('schedules', nargs='+', metavar='team=schedule', help="team name (from teams.py) and its schedule as CSV or ICS file")
+    args = clp.parse_args()
+    games = []
+    for each in args.schedules:
+        try:
+            teamName, filename = each.split('=', 1)
+            team = teams[teamName]
+        except (ValueError, KeyError):
+            sys.exit('%s: expected team=schedule where team is one of: %s.' % (
+                each, ', '.join(sorted(teams))
+            ))
+        for game in readSchedule(filename):
+            games.append(((teamName, game['desc'], game['start']), game, team))
+    assigned, conflicts = allocate(games)
+    for key, game, team in sorted(games, key=lambda each: each[1]['start']):
+        if key in assigned:
+            print '%-10s %s %s: %s' % (
+                assigned[key], time.ctime(game['start']), team.name,
+                game['desc']
+            )
+    for key, game, team, blockers in conflicts:
+        print describeConflict(game, team, blockers)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# Keeps an index of the recordings in each audio directory so that questions
+# such as which games have been recorded, how long they are and how much space
+# they use can be answered without walking the directories and probing every
+# file. The index is an SQLite database kept in the audio directory. It is
+# updated by recorder.py as each recording finishes; a rescan brings it up to
+# date with any changes made by hand, probing only the files whose size or
+# modification time differ from those recorded in the index.
+#
+# Usage:
+#     archive.py [--rescan] [<team> ...]
+# Lists the recordings of the given teams (all teams if none are given).
+
+# Imports {{{1
+from __future__ import division
+from fileutils import expandPath, makePath, getFilesRecursively
+import sqlite3
+import struct
+import time
+import re
+import os
+
+# Globals {{{1
+IndexName = '.recordings.db'
+Encoders = ('ogg', 'mp3', 'spx')
+Complete = 'complete'
+Partial = 'partial'
+RecordingName = re.compile(
+    r'^(\d{2})(\d{2})(\d{2})-(.*?)(?:-(\d{3}))?\.(%s)(\.part)?$' % '|'.join(
+        Encoders
+    )
+)
+Schema = """
+    create table if not exists recordings (
+        path text primary key,  -- relative to the audio directory
+        game text,              -- name of the game (recording name less segment)
+        desc text,              -- description of the game
+        date text,              -- date of the game
+        encoder text,           -- format of the recording
+        duration real,          -- length of the recording in seconds
+        bytes integer,          -- size of the file
+        mtime real,             -- modification time of the file
+        status text             -- 'complete' or 'partial'
+    )
+"""
+
+# Probe {{{1
+def oggDuration(path):
+    """
+    Return the length in seconds of an Ogg Vorbis or Speex file, found from the
+    sample rate given in its header and the granule position of its last page,
+    or None if it cannot be determined.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(128)
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(size - 65536, 0))
+            tail = f.read()
+    except (IOError, OSError):
+        return None
+    if not head.startswith(b'OggS') or len(head) < 28:
+        return None
+    packet = head[27 + ord(head[26:27]):]  # skip the page header and lacing
+    if packet.startswith(b'\x01vorbis') and len(packet) >= 16:
+        rate = struct.unpack('<I', packet[12:16])[0]
+    elif packet.startswith(b'Speex   ') and len(packet) >= 40:
+        rate = struct.unpack('<I', packet[36:40])[0]
+    else:
+        return None
+    last = tail.rfind(b'OggS')
+    if not rate or last < 0 or len(tail) < last + 14:
+        return None
+    granule = struct.unpack('<q', tail[last+6:last+14])[0]
+    return granule/rate if granule > 0 else None
+
+def describe(name):
+    """
+    Return the game, description and date of a recording from its name
+    (ex. '130401-Giants-at-Dodgers-002.ogg'), or None if the name is not that
+    of a recording.
+    """
+    match = RecordingName.match(name)
+    if not match:
+        return None
+    year, month, day, desc, segment, encoder, part = match.groups()
+    try:
+        date = time.strftime(
+            '%0d %B %Y', time.strptime(year + month + day, '%y%m%d')
+        )
+    except ValueError:
+        date = ''
+    game = '%s%s%s-%s' % (year, month, day, desc)
+    return game, desc.replace('-', ' '), date
+
+# Index {{{1
+def openIndex(audioDirectory):
+    """
+    Open the index of an audio directory, creating it if needed.
+    """
+    connection = sqlite3.connect(
+        makePath(expandPath(audioDirectory), IndexName), timeout=30
+    )
+    connection.execute(Schema)
+    return connection
+
+def probe(path, stat, encoder):
+    """
+    Return the duration, size and modification time of a recording.
+    """
+    duration = oggDuration(path) if encoder in ('ogg', 'spx') else None
+    return duration, stat.st_size, stat.st_mtime
+
+def recorded(audioDirectory, game, encoder, elapsed=None, complete=True):
+    """
+    Add the files of a recording that has just finished to the index. Elapsed
+    is the length of the recording, used if it cannot be found from the file.
+    """
+    directory = expandPath(audioDirectory)
+    pattern = re.compile(r'^%s(-\d{3})?\.%s(\.part)?$' % (
+        re.escape(game['filename']), re.escape(encoder)
+    ))
+    files = sorted(
+        name for name in os.listdir(directory) if pattern.match(name)
+    )
+    connection = openIndex(directory)
+    try:
+        with connection:
+            for name in files:
+                path = makePath(directory, name)
+                duration, size, mtime = probe(path, os.stat(path), encoder)
+                if duration is None and len(files) == 1:
+                    duration = elapsed
+                connection.execute(
+                    'insert or replace into recordings values '
+                    '(?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                        name, game['filename'], game['desc'], game['date'],
+                        encoder, duration, size, mtime,
+                        Complete if complete and not name.endswith('.part')
+                        else Partial
+                    )
+                )
+    finally:
+        connection.close()
+
+def forget(audioDirectory, paths):
+    """
+    Remove the given files, which have been deleted, from the index.
+    """
+    directory = expandPath(audioDirectory)
+    if not os.path.exists(makePath(directory, IndexName)):
+        return
+    connection = openIndex(directory)
+    try:
+        with connection:
+            connection.executemany(
+                'delete from recordings where path=?',
+                [(os.path.relpath(path, directory),) for path in paths]
+            )
+    finally:
+        connection.close()
+
+def rescan(audioDirectory):
+    """
+    Bring the index of an audio directory up to date. Only files that are new
+    or whose size or modification time have changed are probed. Returns the
+    number of entries added or refreshed and the number removed.
+    """
+    directory = expandPath(audioDirectory)
+    connection = openIndex(directory)
+    try:
+        with connection:
+            known = dict(
+                (path, (size, mtime)) for path, size, mtime in
+                connection.execute('select path, bytes, mtime from recordings')
+            )
+            refreshed = 0
+            for entry in getFilesRecursively(
+                directory, ['*.%s' % each for each in Encoders] +
+                ['*.%s.part' % each for each in Encoders], '.*', entries=True
+            ):
+                if entry.is_symlink():
+                    continue  # latest.ogg and the like
+                path = os.path.relpath(entry.path, directory)
+                stat = entry.stat()
+                previous = known.pop(path, None)
+                if previous == (stat.st_size, stat.st_mtime):
+                    continue
+                name = os.path.basename(path)
+                encoder = name.replace('.part', '').rsplit('.', 1)[-1]
+                duration, size, mtime = probe(entry.path, stat, encoder)
+                if previous:
+                    connection.execute(
+                        'update recordings set duration=coalesce(?, duration), '
+                        'bytes=?, mtime=? where path=?',
+                        (duration, size, mtime, path)
+                    )
+                else:
+                    status = Partial if name.endswith('.part') else Complete
+                    game, desc, date = describe(name) or (
+                        os.path.splitext(name)[0], name, ''
+                    )
+                    connection.execute(
+                        'insert into recordings values '
+                        '(?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                            path, game, desc, date, encoder, duration, size,
+                            mtime, status
+                        )
+                    )
+                refreshed += 1
+            for path in known:
+                connection.execute(
+                    'delete from recordings where path=?', (path,)
+                )
+        return refreshed, len(known)
+    finally:
+        connection.close()
+
+def games(audioDirectory):
+    """
+    Return a list of the recordings of the games in the index of an audio
+    directory, one for each game and encoder (a game recorded in several
+    formats has one for each). Each is a dictionary that gives the game,
+    desc, date, encoder, duration (in seconds, None if unknown), bytes, the
+    number of files (more than one if the recording was split into
+    segments), and the status (partial if any of its files are partial).
+    """
+    connection = openIndex(audioDirectory)
+    try:
+        rows = connection.execute("""
+            select game, desc, date, encoder, sum(duration), sum(bytes),
+                count(*), min(status = 'complete'), count(duration)
+            from recordings group by game, encoder order by game, encoder
+        """).fetchall()
+    finally:
+        connection.close()
+    return [{
+        'game': game
+      , 'desc': desc
+      , 'date': date
+      , 'encoder': encoder
+      , 'duration': duration if known == files else None
+      , 'bytes': size
+      , 'files': files
+      , 'status': Complete if complete else Partial
+    } for game, desc, date, encoder, duration, size, files, complete, known in rows]
+
+# Main {{{1
+if __name__ == '__main__':
+    from teams import teams
+    import argparse
+    import sys
+    clp = argparse.ArgumentParser(description="List the recorded games.")
+    clp.add_argument('--rescan', '-r', help="bring the index up to date first", action='store_true')
+    clp.add_argument('teams', nargs='*', help="teams to list (default is all)")
+    args = clp.parse_args()
+    for name in args.teams or sorted(teams):
+        if name not in teams:
+            sys.exit('%s: unknown team.' % name)
+        team = teams[name]
+        directory = expandPath(team.audioDirectory)
+        if not os.path.isdir(directory):
+            print '%s: no recordings.' % team.name
+            continue
+        if args.rescan:
+            refreshed, removed = rescan(directory)
+            print '%s: %d entries refreshed, %d removed.' % (
+                team.name, refreshed, removed
+            )
+        recordings = games(directory)
+        print '%s: %d games, %.1f MB.' % (
+            team.name, len(set(game['game'] for game in recordings)),
+            sum(game['bytes'] for game in recordings)/1e6
+        )
+        for game in recordings:
+            duration = game['duration']
+            print '    {:<40s} {:<4s} {:>8s} {:8.1f} MB  {}'.format(
+                game['desc'] + (' (%s)' % game['date'] if game['date'] else ''),
+                game['encoder'],
+                '%d:%02d' % divmod(int(duration)//60, 60) if duration else '?',
+                game['bytes']/1e6, game['status']
+            )
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# Measures each of the encoders used by recorder.py with exactly the commands
+# that record() runs, both when the encoder is fed the 44.1kHz stereo stream
+# from the fin ('pipe' capture) and when it is fed the mono stream produced by
+# dsp.py ('dsp' capture and pre-roll). The same audio is fed to every encoder:
+# either a synthetic imitation of speech or a capture saved with
+#     arecord -c 2 -f S16 -r 44100 -D hw:2,0 -t raw -d 600 capture.raw
+# For each it reports the real-time factor, the CPU seconds and bytes used per
+# hour of recording, and the peak memory used by the encoder. The results are
+# also written as JSON so that encoder settings can be compared over time.
+# Encoders that are not installed are skipped.
+
+# Imports {{{1
+from __future__ import division
+from fins import Info
+from fileutils import which, remove
+from recorder import buildEncoder, EncoderRates
+from dsp import Converter, InputRate, FrameBytes, testSignal
+import subprocess
+import threading
+import argparse
+import tempfile
+import hashlib
+import json
+import time
+import os
+
+# Read command line {{{1
+clp = argparse.ArgumentParser(description="Encoder benchmark")
+clp.add_argument('--seconds', '-s', type=int, default=300, help="length of the synthetic test signal in seconds", action='store')
+clp.add_argument('--fixture', '-f', help="use this raw 44.1kHz 16 bit stereo capture rather than the synthetic signal", action='store')
+clp.add_argument('--json', '-j', default='bench-encoders.json', help="write the report to this file", action='store')
+args = clp.parse_args()
+
+# Run encoder {{{1
+def runEncoder(cmd, data):
+    """
+    Feed data to the encoder and return its wall time, CPU time, peak
+    resident memory (in bytes) and exit status.
+    """
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=devnull, stderr=devnull
+        )
+        def feed():
+            try:
+                process.stdin.write(data)
+            except (IOError, OSError):
+                pass
+            process.stdin.close()
+        feeder = threading.Thread(target=feed)
+        feeder.start()
+        # wait4 gives the resource usage of this encoder alone
+        pid, status, usage = os.wait4(process.pid, 0)
+        wall = time.time() - start
+        if os.WIFSIGNALED(status):
+            status = -os.WTERMSIG(status)
+        else:
+            status = os.WEXITSTATUS(status)
+        process.returncode = status
+        feeder.join()
+    return wall, usage.ru_utime + usage.ru_stime, 1024*usage.ru_maxrss, status
+
+# Main {{{1
+if args.fixture:
+    with open(args.fixture, 'rb') as f:
+        data = f.read()
+    data = data[:len(data) - len(data) % FrameBytes]
+    fixture = {'source': args.fixture}
+else:
+    data = testSignal(args.seconds)
+    fixture = {'source': 'synthetic', 'seed': 0}
+seconds = len(data)/(InputRate*FrameBytes)
+fixture.update(seconds=seconds, sha1=hashlib.sha1(data).hexdigest())
+print 'Fixture: %s, %d seconds of 44.1kHz 16 bit stereo.' % (
+    fixture['source'], seconds
+)
+
+game = {'desc': 'benchmark', 'date': time.strftime('%0d %B %Y')}
+directory = tempfile.mkdtemp()
+results = []
+try:
+    reduced = {}
+    for encoder, rate in sorted(EncoderRates.items()):
+        team = Info(artist='benchmark', encoder=encoder)
+        filename = os.path.join(directory, 'benchmark.' + encoder)
+        for capture in ['pipe', 'dsp']:
+            if capture == 'pipe':
+                cmd = buildEncoder(game, team, filename)
+                audio = data
+            else:
+                cmd = buildEncoder(game, team, filename, rate)
+                if rate not in reduced:
+                    reduced[rate] = Converter(rate).convert(data)
+                audio = reduced[rate]
+            if not which(cmd[0]):
+                print '%s (%s): %s not installed, skipped.' % (
+                    encoder, capture, cmd[0]
+                )
+                continue
+            wall, cpu, rss, status = runEncoder(cmd, audio)
+            size = os.path.getsize(filename) if os.path.exists(filename) else 0
+            remove(filename)
+            result = {
+                'encoder': encoder
+              , 'capture': capture
+              , 'argv': cmd
+              , 'status': status
+              , 'realTimeFactor': wall/seconds
+              , 'cpuSecondsPerHour': 3600*cpu/seconds
+              , 'peakRss': rss
+              , 'bytesPerHour': int(3600*size/seconds)
+            }
+            results.append(result)
+            print (
+                '{encoder} ({capture}): RTF {realTimeFactor:.4f}, '
+                '{cpuSecondsPerHour:.1f} CPU-s/hour, '
+                '{bytesPerHour:,d} bytes/hour, peak RSS {peakRss:,d} bytes'
+            ).format(**result) + ('' if not status else (
+                ', FAILED (exit status %d)' % status
+            ))
+finally:
+    remove(directory)
+
+report = {
+    'date': time.strftime('%Y-%m-%dT%H:%M:%S')
+  , 'host': os.uname()[1]
+  , 'fixture': fixture
+  , 'results': results
+}
+with open(args.json, 'w') as f:
+    json.dump(report, f, indent=2, sort_keys=True)
+print 'Report written to %s.' % args.json
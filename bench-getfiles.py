@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# Measures the time taken by getFilesRecursively (fileutils.py) to find the
+# recordings in an archive, and compares it with the original implementation
+# based on os.walk and fnmatch. A synthetic archive is generated with a
+# directory for each season that holds the recordings and playlists of each
+# game, along with a large directory of partial recordings that is excluded.
+# Also compares finding the total size of the recordings using the stat data
+# returned with the entries against calling os.stat on each path.
+
+# Imports {{{1
+from __future__ import division
+from fileutils import getFilesRecursively, getTail, makePath, splitPath
+from fnmatch import fnmatch
+import argparse
+import tempfile
+import shutil
+import time
+import os
+
+# Read command line {{{1
+clp = argparse.ArgumentParser(description="getFilesRecursively benchmark")
+clp.add_argument('--seasons', '-s', type=int, default=10, help="number of seasons in the archive", action='store')
+clp.add_argument('--games', '-g', type=int, default=200, help="number of games in each season", action='store')
+clp.add_argument('--repeat', '-r', type=int, default=5, help="number of times each search is run", action='store')
+args = clp.parse_args()
+
+# Original implementation {{{1
+def reference(path, acceptCriteria = None, rejectCriteria = None, exclude = None):
+    if type(acceptCriteria) == str:
+        acceptCriteria = [acceptCriteria]
+    if type(rejectCriteria) == str:
+        rejectCriteria = [rejectCriteria]
+    def yieldFile(filename):
+        filename = getTail(filename)
+        if acceptCriteria != None:
+            if rejectCriteria != None:
+                for criterion in rejectCriteria:
+                    if fnmatch(filename, criterion):
+                        return False
+            for criterion in acceptCriteria:
+                if fnmatch(filename, criterion):
+                    return True
+            return False
+        else:
+            if rejectCriteria != None:
+                for criterion in rejectCriteria:
+                    if fnmatch(filename, criterion):
+                        return False
+            return True
+
+    def prepExcludes(exclude):
+        if not exclude:
+            return []
+        if type(exclude) == str:
+            exclude = [exclude]
+        excludes = []
+        for each in exclude:
+            excludes += [splitPath(each)]
+        return excludes
+
+    def skip(path, excludes):
+        for each in excludes:
+            if splitPath(path)[0:len(each)] == each:
+                return True
+        return False
+
+    if os.path.isfile(path):
+        if yieldFile(path):
+            yield path
+    else:
+        excludes = prepExcludes(exclude)
+        for path, subdirs, files in os.walk(path):
+            for file in files:
+                filename = makePath(path, file)
+                if skip(filename, excludes):
+                    continue
+                if yieldFile(filename):
+                    yield filename
+
+# Archive {{{1
+def build(root, seasons, games):
+    for season in range(2000, 2000 + seasons):
+        for team in ('giants', '49ers'):
+            directory = os.path.join(root, 'archive', team, str(season))
+            os.makedirs(directory)
+            for game in range(games):
+                name = os.path.join(directory, '%d%03d-%s-game' % (
+                    season, game, team
+                ))
+                for suffix in ('-001.ogg', '-002.ogg', '-003.ogg', '.m3u'):
+                    open(name + suffix, 'w').close()
+        partial = os.path.join(root, 'archive', 'partial', str(season))
+        os.makedirs(partial)
+        for game in range(games):
+            open(os.path.join(partial, '%03d.ogg.part' % game), 'w').close()
+
+# Timing {{{1
+def best(function):
+    times = []
+    for i in range(args.repeat):
+        start = time.time()
+        result = function()
+        times.append(time.time() - start)
+    return min(times), result
+
+def report(name, seconds, count):
+    print '    {:<36s} {:8.2f} ms  {:6d} files'.format(
+        name, 1000*seconds, count
+    )
+
+# Main {{{1
+root = tempfile.mkdtemp()
+cwd = os.getcwd()
+try:
+    build(root, args.seasons, args.games)
+    os.chdir(root)
+    searches = [
+        ('all files', ('archive', None, None, None)),
+        ('recordings', ('archive', ['*.ogg', '*.mp3', '*.spx'], None, None)),
+        ('recordings, excluding partial', (
+            'archive', ['*.ogg', '*.mp3', '*.spx'], ['.*', '*.part'],
+            ['archive/partial']
+        )),
+    ]
+    print 'Archive: %d seasons of %d games for 2 teams.' % (
+        args.seasons, args.games
+    )
+    for name, criteria in searches:
+        print '%s:' % name.capitalize()
+        oldTime, old = best(lambda: list(reference(*criteria)))
+        newTime, new = best(lambda: list(getFilesRecursively(*criteria)))
+        assert old == new, 'results differ'
+        report('original', oldTime, len(old))
+        report('new', newTime, len(new))
+        print '    speed up: %.1fx' % (oldTime/newTime)
+    criteria = searches[-1][1]
+    print 'Total size of recordings:'
+    oldTime, old = best(lambda: [
+        os.stat(path).st_size for path in reference(*criteria)
+    ])
+    newTime, new = best(lambda: [
+        entry.stat().st_size
+        for entry in getFilesRecursively(*criteria, entries=True)
+    ])
+    assert old == new, 'results differ'
+    report('original with os.stat', oldTime, len(old))
+    report('new with entries', newTime, len(new))
+    print '    speed up: %.1fx' % (oldTime/newTime)
+finally:
+    os.chdir(cwd)
+    shutil.rmtree(root)
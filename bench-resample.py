@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# Measures the cost of downmixing and resampling the 44.1kHz stereo stream from
+# the fin using the in-process resampler (dsp.py) and compares it with the cost
+# of letting the encoders do it themselves. The encoder cost is estimated by
+# encoding the same audio twice, once as 44.1kHz stereo (the encoder downmixes
+# and resamples) and once already reduced to mono at the encoder rate; the
+# difference is the price of the encoder's own resampling. Encoders that are not
+# installed are skipped.
+
+# Imports {{{1
+from __future__ import division
+from fins import Info
+from fileutils import which
+from recorder import buildEncoder, EncoderRates
+from dsp import Converter, InputRate, testSignal
+import numpy as np
+import subprocess
+import argparse
+import time
+import os
+
+# Read command line {{{1
+clp = argparse.ArgumentParser(description="Resampler benchmark")
+clp.add_argument('--seconds', '-s', type=int, default=300, help="length of the test signal in seconds", action='store')
+args = clp.parse_args()
+
+# Timing {{{1
+def cpuTime(children=False):
+    times = os.times()
+    return times[2] + times[3] if children else times[0] + times[1]
+
+def runInProcess(data, rate, blockSize=44100*4):
+    converter = Converter(rate)
+    out = []
+    wall, cpu = time.time(), cpuTime()
+    for i in range(0, len(data), blockSize):
+        out.append(converter.convert(data[i:i+blockSize]))
+    return time.time() - wall, cpuTime() - cpu, b''.join(out)
+
+def runEncoder(cmd, data):
+    wall, cpu = time.time(), cpuTime(True)
+    with open(os.devnull, 'w') as devnull:
+        process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=devnull, stderr=devnull
+        )
+        process.communicate(data)
+    return time.time() - wall, cpuTime(True) - cpu
+
+def report(name, seconds, wall, cpu):
+    print '    {:<28s} RTF {:8.5f}   {:8.2f} CPU-s/hour'.format(
+        name, wall/seconds, 3600*cpu/seconds
+    )
+
+# Main {{{1
+seconds = args.seconds
+data = testSignal(seconds)
+game = {'desc': 'benchmark', 'date': time.strftime('%0d %B %Y')}
+print 'Test signal: %d seconds of 44.1kHz 16 bit stereo.' % seconds
+
+print 'In-process resampler (dsp.py):'
+reduced = {}
+for rate in [8000, 11025, 16000]:
+    wall, cpu, reduced[rate] = runInProcess(data, rate)
+    report('44100 -> %d' % rate, seconds, wall, cpu)
+
+print 'Encoder resampling:'
+for encoder, rate in sorted(EncoderRates.items()):
+    team = Info(artist='benchmark', encoder=encoder)
+    native = buildEncoder(game, team, os.devnull)
+    if not which(native[0]):
+        print '    %s: not installed, skipped.' % native[0]
+        continue
+    wall, cpu = runEncoder(native, data)
+    report('%s (44100 stereo)' % native[0], seconds, wall, cpu)
+    mono = buildEncoder(game, team, os.devnull, rate)
+    monoWall, monoCpu = runEncoder(mono, reduced[rate])
+    report('%s (%d mono)' % (native[0], rate), seconds, monoWall, monoCpu)
+    report('%s resampling' % native[0], seconds, wall - monoWall, cpu - monoCpu)
@@ -0,0 +1,210 @@
+# Scheduling by wall-clock time that survives the clock being changed. Events
+# are given as absolute times (seconds since the epoch). Waiting is done with a
+# Linux timerfd armed on the real-time clock with TFD_TIMER_CANCEL_ON_SET, so
+# if the clock is stepped (by NTP, by hand, or on resume from suspend) the wait
+# is interrupted and re-armed against the new time. Where timerfd is not
+# available the wait is done in short slices, each of which re-reads the clock.
+
+# Imports {{{1
+import os
+import time
+import errno
+import heapq
+import select
+import itertools
+
+# Globals {{{1
+MaxSleep = 60 # seconds, longest single sleep when timerfd is not available
+CLOCK_REALTIME = 0
+TFD_TIMER_ABSTIME = 1
+TFD_TIMER_CANCEL_ON_SET = 2
+TFD_CLOEXEC = 0o2000000
+
+# Timer {{{1
+class Timer(object):
+    """
+    A timerfd on the real-time clock. Raises OSError if timerfd is not
+    available.
+    """
+    def __init__(self):
+        import ctypes, ctypes.util
+        class Timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+        class Itimerspec(ctypes.Structure):
+            _fields_ = [('it_interval', Timespec), ('it_value', Timespec)]
+        self.Itimerspec = Itimerspec
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            self.settime = libc.timerfd_settime
+            fd = libc.timerfd_create(
+                CLOCK_REALTIME, os.O_NONBLOCK | TFD_CLOEXEC
+            )
+        except AttributeError:
+            raise OSError(errno.ENOSYS, 'timerfd is not available')
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.fd = fd
+
+    def arm(self, when):
+        """
+        Make the timer expire at when (seconds since the epoch).
+        """
+        import ctypes
+        spec = self.Itimerspec()
+        seconds = int(when)
+        spec.it_value.tv_sec = seconds
+        spec.it_value.tv_nsec = max(int((when - seconds)*1e9), 1)
+        if self.settime(
+            self.fd, TFD_TIMER_ABSTIME | TFD_TIMER_CANCEL_ON_SET,
+            ctypes.byref(spec), None
+        ) < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def clear(self):
+        """
+        Acknowledge the timer. Returns False if the wait was cut short because
+        the clock was changed.
+        """
+        try:
+            os.read(self.fd, 8)
+        except OSError as err:
+            if err.errno == errno.ECANCELED:
+                return False
+            if err.errno != errno.EAGAIN:
+                raise
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+def makeTimer():
+    try:
+        return Timer()
+    except OSError:
+        return None
+
+# Monotonic clock {{{1
+CLOCK_MONOTONIC = 1
+
+def makeMonotonic():
+    """
+    Return a function that gives the time in seconds on a clock that is never
+    changed, for measuring intervals. Falls back to the real-time clock if no
+    monotonic clock is available.
+    """
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    import ctypes, ctypes.util
+    class Timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        gettime = libc.clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+    def monotonic():
+        spec = Timespec()
+        if gettime(CLOCK_MONOTONIC, ctypes.byref(spec)) < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return spec.tv_sec + spec.tv_nsec*1e-9
+    return monotonic
+
+monotonic = makeMonotonic()
+
+# Sleep until {{{1
+def sleepUntil(when, timer=None):
+    """
+    Sleep until the clock reads when (seconds since the epoch).
+    """
+    own = timer is None
+    if own:
+        timer = makeTimer()
+    try:
+        while True:
+            remaining = when - time.time()
+            if remaining <= 0:
+                return
+            if timer:
+                timer.arm(when)
+                select.select([timer.fd], [], [])
+                timer.clear()
+            else:
+                time.sleep(min(remaining, MaxSleep))
+    finally:
+        if own and timer:
+            timer.close()
+
+# Scheduler {{{1
+class Scheduler(object):
+    """
+    Runs actions at given times, like sched.scheduler, but waits on a timerfd
+    so changes to the clock are noticed at once. If a watcher (see watch.py) is
+    given, it is checked while waiting, and its callback may add and cancel
+    events.
+    """
+    def __init__(self, watcher=None):
+        self.queue = []
+        self.counter = itertools.count()
+        self.watcher = watcher
+        self.timer = makeTimer()
+
+    def enterabs(self, when, priority, action, argument=()):
+        event = [when, priority, next(self.counter), action, argument]
+        heapq.heappush(self.queue, event)
+        return event
+
+    def enter(self, delay, priority, action, argument=()):
+        return self.enterabs(time.time() + delay, priority, action, argument)
+
+    def cancel(self, event):
+        self.queue.remove(event)
+        heapq.heapify(self.queue)
+
+    def empty(self):
+        return not self.queue
+
+    def run(self):
+        while self.queue:
+            when = self.queue[0][0]
+            if when > time.time():
+                self.wait(when)
+                continue
+            when, priority, count, action, argument = heapq.heappop(self.queue)
+            action(*argument)
+
+    def wait(self, when):
+        """
+        Wait until when, until the clock is changed, or until a watched file
+        changes, whichever comes first.
+        """
+        fds = []
+        timeout = None
+        if self.timer:
+            self.timer.arm(when)
+            fds.append(self.timer.fd)
+        else:
+            timeout = max(min(when - time.time(), MaxSleep), 0)
+        watcher = self.watcher
+        if watcher:
+            if watcher.fd is None:
+                from watch import PollInterval
+                timeout = PollInterval if timeout is None else min(
+                    timeout, PollInterval
+                )
+            else:
+                fds.append(watcher.fd)
+        try:
+            readable = select.select(fds, [], [], timeout)[0]
+        except select.error as err:
+            # interrupted by a signal, the caller simply waits again
+            if err.args[0] != errno.EINTR:
+                raise
+            return
+        if self.timer and self.timer.fd in readable:
+            if not self.timer.clear():
+                print 'Clock was changed, rescheduling.'
+        if watcher and (watcher.fd is None or watcher.fd in readable):
+            watcher.handle()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# Finds which audio device belongs to which fin without anyone having to
+# listen. The RadioSHARK capture devices are found in /proc/asound and the fins
+# are addressed through finctrl.py. Every fin is then switched back and forth
+# between two stations that sound very different (by default a music station
+# on FM and a talk station on AM), all at once, each following its own
+# pattern; the patterns are rows of a Hadamard matrix, so no two are alike and
+# none is the inverse of another. After each switch, every audio device is
+# captured for a moment, all at the same time, and the spectrum of each
+# capture is measured. The spectrum of a device follows the pattern of the fin
+# that feeds it, so each device is matched to the fin whose pattern explains
+# most of the change in its spectrum. A match is only accepted if it is strong
+# and clearly better than the next best.
+#
+# Usage:
+#     discover.py [--write] [--stations <station> <station>]
+# Prints the mapping found and, with --write, saves it to DiscoveredAddrs
+# (see fins.py), where the daemons pick it up. The fins are retuned, so do not
+# run it while recording.
+
+# Imports {{{1
+from __future__ import division
+from fins import fins, Info, DiscoveredAddrs
+from fileutils import expandPath, spawn, reap, ExecuteError
+from finctrl import control, findDevices
+import numpy as np
+import threading
+import json
+import time
+import re
+import os
+
+# Globals {{{1
+Stations = ('-fm 97.7', '-am 680') # distinct sounds: music and sports talk
+Settle = 0.5 # seconds to wait after tuning before capturing
+ClipLength = 1.0 # seconds captured from each device after each switch
+Bands = 24 # number of bands in the spectrum of each capture
+FrameSize = 2048 # samples in each frame of the spectrum
+MinScore = 0.5 # least fraction of the change explained by the matched fin
+MinMargin = 2 # least ratio between the best and the next best score
+ProcAsound = '/proc/asound'
+CardLine = re.compile(
+    r'^\s*(\d+)\s+\[([^\]]*)\]:\s*(.*?)\n\s*(.*)$', re.MULTILINE
+)
+UsbLocation = re.compile(r' at (usb-\S+?),')
+
+# Find the audio devices {{{1
+def audioDevices(proc=ProcAsound, name='RadioSHARK'):
+    """
+    Return the capture devices of the fins as a list of (audioAddr, location)
+    pairs, where audioAddr is 'hw:C,D' and location is the USB location of the
+    card (or None).
+    """
+    try:
+        with open(os.path.join(proc, 'cards')) as f:
+            cards = f.read()
+    except IOError:
+        return []
+    found = []
+    for card, id, description, detail in CardLine.findall(cards):
+        if name not in id and name not in description:
+            continue
+        location = UsbLocation.search(detail)
+        try:
+            entries = os.listdir(os.path.join(proc, 'card%s' % card))
+        except OSError:
+            continue
+        for entry in sorted(entries):
+            if entry.startswith('pcm') and entry.endswith('c'):
+                found.append((
+                    'hw:%s,%s' % (card, entry[3:-1]),
+                    location.group(1) if location else None
+                ))
+    return found
+
+def controlAddresses(count):
+    """
+    Return the control addresses of the fins, one for each hidraw device
+    found, or count of them if the hidraw devices cannot be found (sharkctrl
+    numbers the fins in the same way).
+    """
+    return [str(i) for i in range(len(findDevices()) or count)]
+
+# Patterns {{{1
+def patterns(count):
+    """
+    Return count patterns of stations (as arrays of 0 and 1) from the rows of
+    a Hadamard matrix, skipping the first row, which is constant. The rows are
+    balanced and orthogonal, and there are at least four steps so that each
+    station is heard at least twice.
+    """
+    hadamard = np.ones((1, 1))
+    while len(hadamard) < max(count + 1, 4):
+        hadamard = np.vstack((
+            np.hstack((hadamard, hadamard)), np.hstack((hadamard, -hadamard))
+        ))
+    return (hadamard[1:count+1] > 0).astype(int)
+
+# Measure {{{1
+def spectrum(data, bands=Bands, frameSize=FrameSize, rate=44100):
+    """
+    Return the average log power in each of bands logarithmically spaced
+    bands (50Hz to half the rate) of raw 16 bit stereo audio.
+    """
+    samples = np.frombuffer(data, dtype='<i2').astype(np.float32)
+    mono = samples[:len(samples)//2*2].reshape(-1, 2).mean(axis=1)
+    frames = len(mono)//frameSize
+    if not frames:
+        return np.zeros(bands)
+    mono = mono[:frames*frameSize].reshape(frames, frameSize)
+    power = np.abs(np.fft.rfft(mono*np.hanning(frameSize), axis=1))**2
+    power = power.mean(axis=0)
+    edges = np.logspace(np.log10(50), np.log10(rate/2), bands + 1)
+    band = np.digitize(np.fft.rfftfreq(frameSize, 1/rate), edges) - 1
+    inside = (band >= 0) & (band < bands)
+    sums = np.bincount(band[inside], power[inside], bands)
+    counts = np.bincount(band[inside], minlength=bands)
+    return np.log10(sums/np.maximum(counts, 1) + 1)
+
+def scores(features, steps):
+    """
+    Return the fraction of the change in the features of each device (an
+    array indexed by device, step and band) explained by each pattern (an
+    array indexed by fin and step) as an array indexed by device and fin.
+    """
+    signs = 2*steps - 1
+    deviations = features - features.mean(axis=1, keepdims=True)
+    total = (deviations**2).sum(axis=(1, 2))
+    # the patterns are orthogonal, so the projections partition the change
+    projections = np.einsum('dsb,fs->dfb', deviations, signs)
+    explained = (projections**2).sum(axis=2)/signs.shape[1]
+    return explained/np.maximum(total, 1e-12)[:, None]
+
+def match(score, audioAddrs, ctrlAddrs):
+    """
+    Match each device to the fin whose pattern best explains it. Returns the
+    mapping from ctrlAddr to audioAddr of the matches that are accepted and a
+    list of the problems found.
+    """
+    mapping = {}
+    problems = []
+    for d, audioAddr in enumerate(audioAddrs):
+        ranked = np.argsort(score[d])[::-1]
+        best = score[d, ranked[0]]
+        second = score[d, ranked[1]] if len(ranked) > 1 else 0
+        ctrlAddr = ctrlAddrs[ranked[0]]
+        if best < MinScore:
+            problems.append('%s: no fin found (best score %.2f).' % (
+                audioAddr, best
+            ))
+        elif best < MinMargin*second:
+            problems.append('%s: ambiguous, fin %s or %s (%.2f vs %.2f).' % (
+                audioAddr, ctrlAddr, ctrlAddrs[ranked[1]], best, second
+            ))
+        elif ctrlAddr in mapping:
+            problems.append('%s: fin %s already matched to %s.' % (
+                audioAddr, ctrlAddr, mapping[ctrlAddr]
+            ))
+        else:
+            mapping[ctrlAddr] = audioAddr
+    return mapping, problems
+
+# Probe {{{1
+def tuneAll(ctrlAddrs, stations):
+    """
+    Tune each fin (given by its ctrlAddr) to the corresponding station.
+    """
+    for ctrlAddr, station in zip(ctrlAddrs, stations):
+        control(Info(ctrlAddr=ctrlAddr, audioAddr=None)).station(station)
+
+def captureAll(audioAddrs, seconds):
+    """
+    Capture seconds of raw 44.1kHz 16 bit stereo audio from each of the
+    devices at the same time. Returns the captures in the order of the
+    devices (an empty string for a device that could not be captured).
+    """
+    from recorder import buildRecorder
+    from subprocess import PIPE
+    captures = [b''] * len(audioAddrs)
+    def read(index, process):
+        captures[index] = process.stdout.read(int(seconds*44100)*4)
+    processes = []
+    try:
+        for audioAddr in audioAddrs:
+            processes.append(spawn(
+                buildRecorder(Info(audioAddr=audioAddr)), stdout=PIPE
+            ))
+        readers = [
+            threading.Thread(target=read, args=each)
+            for each in enumerate(processes)
+        ]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+    finally:
+        for process in processes:
+            process.terminate()
+            process.stdout.close()
+            reap(process)
+    return captures
+
+def discover(
+    audioAddrs, ctrlAddrs, stations=Stations, tune=tuneAll,
+    capture=captureAll
+):
+    """
+    Find which device is fed by which fin. The fins are retuned with tune and
+    the devices are captured with capture (see tuneAll and captureAll, which
+    may be replaced by stand-ins for testing). Returns the mapping from
+    ctrlAddr to audioAddr of the devices that were matched, the scores (see
+    scores), and a list of the problems found.
+    """
+    steps = patterns(len(ctrlAddrs))
+    features = np.zeros((len(audioAddrs), steps.shape[1], Bands))
+    for step in range(steps.shape[1]):
+        tune(ctrlAddrs, [stations[bit] for bit in steps[:, step]])
+        time.sleep(Settle)
+        for d, data in enumerate(capture(audioAddrs, ClipLength)):
+            features[d, step] = spectrum(data)
+    score = scores(features, steps)
+    mapping, problems = match(score, audioAddrs, ctrlAddrs)
+    return mapping, score, problems
+
+# Apply {{{1
+def apply(mapping, fins=fins):
+    """
+    Give each fin the audioAddr matched to its ctrlAddr. Returns the names of
+    the fins that were not matched.
+    """
+    unmatched = []
+    for name, fin in sorted(fins.items()):
+        if fin.ctrlAddr in mapping:
+            fin.audioAddr = mapping[fin.ctrlAddr]
+        else:
+            unmatched.append(name)
+    return unmatched
+
+def save(fins=fins, path=DiscoveredAddrs):
+    """
+    Save the addresses of the fins where fins.py will find them.
+    """
+    path = expandPath(path)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(dict(
+            (name, {'audioAddr': fin.audioAddr, 'ctrlAddr': fin.ctrlAddr})
+            for name, fin in fins.items()
+        ), f, indent=2, sort_keys=True)
+    os.rename(path + '.tmp', path)
+
+def discoverFins(stations=Stations, write=False):
+    """
+    Find the addresses of the fins, update the fins (from fins.py) to match,
+    and save them if write is true and every fin was matched. Returns True if
+    every fin was matched.
+    """
+    devices = audioDevices()
+    if not devices:
+        print 'No RadioSHARK capture devices found in %s.' % ProcAsound
+        return False
+    audioAddrs = [audioAddr for audioAddr, location in devices]
+    ctrlAddrs = controlAddresses(len(audioAddrs))
+    print 'Matching %d fins to %s.' % (len(ctrlAddrs), ', '.join(audioAddrs))
+    try:
+        mapping, score, problems = discover(audioAddrs, ctrlAddrs, stations)
+    except ExecuteError as err:
+        print 'discover: %s' % err
+        return False
+    for problem in problems:
+        print problem
+    unmatched = apply(mapping)
+    for name, fin in sorted(fins.items()):
+        print '%s: audioAddr=%s, ctrlAddr=%s%s' % (
+            name, fin.audioAddr, fin.ctrlAddr,
+            ' (not matched, unchanged)' if name in unmatched else ''
+        )
+    if unmatched or problems:
+        return False
+    if write:
+        save()
+        print 'Saved to %s.' % DiscoveredAddrs
+    return True
+
+# Main {{{1
+if __name__ == '__main__':
+    import argparse
+    import sys
+    clp = argparse.ArgumentParser(description="Find the addresses of the fins.")
+    clp.add_argument('--write', '-w', help="save the addresses found (see fins.py)", action='store_true')
+    clp.add_argument('--stations', '-s', nargs=2, default=Stations, metavar='station', help="two stations that sound different, as sharkctrl arguments (default '%s' and '%s')" % Stations, action='store')
+    args = clp.parse_args()
+    if not discoverFins(args.stations, args.write):
+        sys.exit('Addresses could not be confirmed.')
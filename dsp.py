@@ -0,0 +1,118 @@
+# Signal processing used when capturing audio in-process. Converts the 44.1kHz
+# 16 bit stereo stream produced by the fin into the low rate mono stream that is
+# sent to the encoder. Requires numpy.
+
+# Imports {{{1
+from __future__ import division
+import numpy as np
+
+# Globals {{{1
+InputRate = 44100
+InputChannels = 2
+SampleWidth = 2 # bytes (S16_LE)
+FrameBytes = InputChannels*SampleWidth
+
+# Downmix {{{1
+def downmix(data):
+    """
+    Convert a string of interleaved 16 bit stereo samples into an array of
+    mono samples (as floats).
+    """
+    frames = np.frombuffer(data, dtype='<i2').reshape(-1, InputChannels)
+    return frames.mean(axis=1, dtype=np.float32)
+
+# Low-pass filter {{{1
+def lowpass(cutoff, taps):
+    """
+    Return the coefficients of a windowed-sinc low-pass filter. Cutoff is given
+    as a fraction of the sample rate.
+    """
+    n = np.arange(taps) - (taps - 1)/2
+    h = 2*cutoff*np.sinc(2*cutoff*n)*np.hamming(taps)
+    return (h/h.sum()).astype(np.float32)
+
+# Resampler {{{1
+class Resampler(object):
+    """
+    Streaming polyphase resampler. Converts from inRate to outRate by
+    conceptually upsampling by up, low-pass filtering, and downsampling by
+    down, where up/down is outRate/inRate in lowest terms. Only the filter
+    phases needed for the retained output samples are ever evaluated. The last
+    few input samples and the phase of the next output sample are carried from
+    one block to the next, so the stream may be processed in blocks of any size
+    and memory use does not grow with the length of the stream.
+    """
+    def __init__(self, inRate, outRate, taps=64):
+        divisor = gcd(inRate, outRate)
+        self.up = outRate//divisor
+        self.down = inRate//divisor
+        self.taps = taps
+        cutoff = 0.45/max(self.up, self.down)
+        h = self.up*lowpass(cutoff, self.up*taps)
+        # phases[p] holds the taps of phase p in the order they are applied to
+        # the window of input samples that ends with the most recent sample
+        self.phases = h.reshape(taps, self.up).T[:, ::-1].copy()
+        self.history = np.zeros(taps - 1, dtype=np.float32)
+        self.offset = 0 # position of next output on upsampled grid
+
+    def process(self, samples):
+        samples = np.asarray(samples, dtype=np.float32)
+        x = np.concatenate((self.history, samples))
+        self.history = x[len(samples):]
+        span = len(samples)*self.up
+        count = max(-(-(span - self.offset)//self.down), 0)
+        u = self.offset + self.down*np.arange(count)
+        self.offset += count*self.down - span
+        windows = np.lib.stride_tricks.as_strided(
+            x
+          , shape=(len(samples), self.taps)
+          , strides=(x.strides[0], x.strides[0])
+        )
+        return np.einsum(
+            'ij,ij->i', self.phases[u % self.up], windows[u//self.up]
+        )
+
+def gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+# Converter {{{1
+class Converter(object):
+    """
+    Converts blocks of raw 44.1kHz 16 bit stereo audio into raw 16 bit mono
+    audio at the output rate. Blocks need not contain a whole number of frames.
+    """
+    def __init__(self, outRate, inRate=InputRate):
+        self.resampler = Resampler(inRate, outRate)
+        self.partial = b''
+
+    def convert(self, data):
+        data = self.partial + data
+        whole = len(data) - len(data) % FrameBytes
+        self.partial = data[whole:]
+        samples = self.resampler.process(downmix(data[:whole]))
+        return toBytes(samples)
+
+def toBytes(samples):
+    """
+    Convert an array of float samples into a string of 16 bit samples.
+    """
+    return np.clip(np.rint(samples), -32768, 32767).astype('<i2').tobytes()
+
+# Test signal {{{1
+def testSignal(seconds, seed=0):
+    """
+    Return a string of 44.1kHz 16 bit stereo samples that contains a crude
+    imitation of speech: harmonics of a wandering pitch, amplitude modulated at
+    syllable rate, plus some noise.
+    """
+    rng = np.random.RandomState(seed)
+    t = np.arange(seconds*InputRate)/InputRate
+    pitch = 120 + 30*np.sin(2*np.pi*0.3*t)
+    phase = 2*np.pi*np.cumsum(pitch)/InputRate
+    voice = sum(np.sin(k*phase)/k for k in range(1, 20))
+    envelope = 0.5 + 0.5*np.sin(2*np.pi*4*t)**2
+    mono = 6000*voice*envelope + 300*rng.randn(len(t))
+    stereo = np.repeat(np.clip(mono, -32768, 32767).astype('<i2'), 2)
+    return stereo.tobytes()
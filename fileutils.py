@@ -1,5 +1,4 @@
-import os, errno
-from fnmatch import fnmatch
+import os, errno, select
 
 """Various utilities for interacting with files and directories."""
 
@@ -26,7 +25,70 @@ def getDirs(pattern='*'):
     """
     return [each for each in getAll(pattern) if os.path.isdir(each)]
 
-def getFilesRecursively(path, acceptCriteria = None, rejectCriteria = None, exclude = None):
+def globsToRegex(globs):
+    """
+    Compile a list of glob strings into a single regular expression that
+    matches a name if any of the globs match it (exactly as fnmatch would), or
+    return None if globs is None.
+    """
+    import re
+    from fnmatch import translate
+    if globs is None:
+        return None
+    patterns = [
+        # remove the end-of-string anchor (and, in older Pythons, the flags
+        # that follow it) so the patterns can be combined
+        re.sub(r'\\[Zz](\(\?ms\))?$', '', translate(os.path.normcase(glob)))
+        for glob in globs
+    ]
+    return re.compile(
+        r'(?s)(?:%s)\Z' % '|'.join('(?:%s)' % each for each in patterns)
+        if patterns else r'(?!)'
+    )
+
+class FileEntry(object):
+    """
+    Stands in for os.DirEntry where scandir is not available. The same methods
+    are provided, but each makes a system call.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.name = getTail(path)
+
+    def is_dir(self, follow_symlinks=True):
+        if not follow_symlinks and os.path.islink(self.path):
+            return False
+        return os.path.isdir(self.path)
+
+    def is_file(self, follow_symlinks=True):
+        if not follow_symlinks and os.path.islink(self.path):
+            return False
+        return os.path.isfile(self.path)
+
+    def is_symlink(self):
+        return os.path.islink(self.path)
+
+    def stat(self, follow_symlinks=True):
+        return (os.stat if follow_symlinks else os.lstat)(self.path)
+
+def scanDir(path):
+    """
+    Return the entries of a directory as os.DirEntry objects (or FileEntry
+    objects if scandir is not available).
+    """
+    try:
+        scandir = os.scandir
+    except AttributeError:
+        try:
+            from scandir import scandir
+        except ImportError:
+            return [FileEntry(makePath(path, name)) for name in os.listdir(path)]
+    return list(scandir(path))
+
+def getFilesRecursively(
+    path, acceptCriteria = None, rejectCriteria = None, exclude = None,
+    entries = False
+):
     """
     Returns a generator that iterates through all the files contained in a
     directory hierarchy.  Accept and reject criteria are glob strings, or lists
@@ -35,57 +97,66 @@ def getFilesRecursively(path, acceptCriteria = None, rejectCriteria = None, excl
     criteria, if any are given.  If no criteria are given, all files are
     returned. Exclude is a file or directory or a list of files or directories
     to exclude. Each is specified relative from the current working directory.
+    Excluded directories are not descended into.
+
+    If entries is true, os.DirEntry objects are returned rather than paths, so
+    the file type and stat information gathered while reading the directories
+    can be used without further system calls.
     """
     if type(acceptCriteria) == str:
         acceptCriteria = [acceptCriteria]
     if type(rejectCriteria) == str:
         rejectCriteria = [rejectCriteria]
-    def yieldFile(filename):
-        filename = getTail(filename)
-        if acceptCriteria != None:
-            if rejectCriteria != None:
-                for criterion in rejectCriteria:
-                    if fnmatch(filename, criterion):
-                        return False
-            for criterion in acceptCriteria:
-                if fnmatch(filename, criterion):
-                    return True
+    accept = globsToRegex(acceptCriteria)
+    reject = globsToRegex(rejectCriteria)
+
+    def yieldFile(name):
+        name = os.path.normcase(name)
+        if reject and reject.match(name):
             return False
-        else:
-            if rejectCriteria != None:
-                for criterion in rejectCriteria:
-                    if fnmatch(filename, criterion):
-                        return False
-            return True
-
-    def prepExcludes(exclude):
-        if not exclude:
-            return []
-        if type(exclude) == str:
-            exclude = [exclude]
-        excludes = []
-        for each in exclude:
-            excludes += [splitPath(each)]
-        return excludes
-
-    def skip(path, excludes):
-        for each in excludes:
-            if splitPath(path)[0:len(each)] == each:
-                return True
-        return False
+        return not accept or bool(accept.match(name))
+
+    if not exclude:
+        exclude = []
+    elif type(exclude) == str:
+        exclude = [exclude]
+    excludes = set(tuple(splitPath(each)) for each in exclude)
+
+    def components(directory):
+        # the components of the paths of the files in directory, less the name
+        return tuple(splitPath(makePath(directory, '')))[:-1]
 
     if isFile(path):
-        if yieldFile(path):
-            yield path
-    else:
-        excludes = prepExcludes(exclude)
-        for path, subdirs, files in os.walk(path):
-            for file in files:
-                filename = makePath(path, file)
-                if skip(filename, excludes):
-                    continue
-                if yieldFile(filename):
-                    yield filename
+        if yieldFile(getTail(path)):
+            yield FileEntry(path) if entries else path
+        return
+    top = components(path)
+    if any(top[:len(each)] == each for each in excludes):
+        return
+    # walk the hierarchy in the same order as os.walk, top-down: the files in a
+    # directory are returned before those in its subdirectories
+    stack = [(path, top)]
+    while stack:
+        directory, parts = stack.pop()
+        try:
+            contents = scanDir(directory)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in contents:
+            entryParts = parts + (entry.name,)
+            if entryParts in excludes:
+                continue
+            try:
+                isDirectory = entry.is_dir()
+            except OSError:
+                isDirectory = False
+            if isDirectory:
+                if not entry.is_symlink():
+                    subdirs.append((entry.path, entryParts))
+            elif yieldFile(entry.name):
+                yield entry if entries else entry.path
+        stack.extend(reversed(subdirs))
 
 # Type Utilities {{{1
 def isFile(path):
@@ -322,6 +393,28 @@ class ExecuteError(Exception):
         )
         return "%s: %s." % (filename, self.error)
 
+def commandLine(cmd):
+    return cmd if type(cmd) is str else ' '.join(cmd)
+
+# Tracing {{{2
+# If set, trace(name, command=...) is used to time each command that is run.
+# It must return a context manager whose value has an attributes dictionary
+# to which the exit status is added (timing.span in sharkd.py).
+trace = None
+
+class Untraced(object):
+    def __init__(self, name, **attributes):
+        self.attributes = attributes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        return False
+
+def traced(name, **attributes):
+    return (trace or Untraced)(name, **attributes)
+
 # Execute: Runs a shell command ignoring streams {{{2
 def execute(cmd, accept = (0,), shell=True):
     """
@@ -329,44 +422,192 @@ def execute(cmd, accept = (0,), shell=True):
     If accept is True, all exit status values are accepted.
     """
     import subprocess
-    try:
-        status = subprocess.call(cmd, shell=shell)
-    except (IOError, OSError) as err:
-        raise ExecuteError(cmd, err.filename, err.strerror)
+    with traced('execute', command=commandLine(cmd)) as span:
+        try:
+            status = subprocess.call(cmd, shell=shell)
+        except (IOError, OSError) as err:
+            raise ExecuteError(cmd, err.filename, err.strerror)
+        span.attributes['status'] = status
     if accept is not True and status not in accept:
         raise ExecuteError(cmd, "unexpected exit status (%d)" % status)
     return status
 
 # Pipe: Runs a shell command with access to streams {{{2
-def pipe(cmd, stdin = '', accept = (0,), shell=True):
+def pipe(
+    cmd, stdin = '', accept = (0,), shell=True, callback=None, timeout=None,
+    limit=None
+):
     """
     Execute a command and returns the exit status and stdout as a string.
     Raise an ExecuteError if return status is not in accept unless accept is set
     to True. Only a status of 0 will be accepted if None is passed as the value
     of accept.
+
+    If callback is given, stdout is passed to it in chunks as it arrives (see
+    Stream) rather than being collected, and an empty string is returned in its
+    place. Timeout and limit are as for Stream, except that without a callback
+    limit also bounds the total stdout collected.
     """
-    import subprocess
-    try:
-        process = subprocess.Popen(
-            cmd, shell=shell,
-            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
+    with traced('pipe', command=commandLine(cmd)) as span:
+        process = Stream(
+            cmd, stdin, accept=accept, shell=shell, timeout=timeout,
+            limit=limit
         )
-    except (IOError, OSError) as err:
-        raise ExecuteError(cmd, err.filename, err.strerror)
-    process.stdin.write(stdin.encode('utf-8'))
-    process.stdin.close()
-    stdout = process.stdout.read().decode('utf-8')
-    stderr = process.stderr.read().decode('utf-8')
-    status = process.wait()
-    process.stdout.close()
-    process.stderr.close()
-    if accept is not True and status not in accept:
-        if stderr:
-            raise ExecuteError(cmd, stderr)
-        else:
-            raise ExecuteError(cmd, "unexpected exit status (%d)" % status)
-    return (status, stdout)
+        chunks = []
+        total = 0
+        try:
+            for chunk in process:
+                if callback:
+                    callback(chunk)
+                    continue
+                total += len(chunk)
+                if limit is not None and total > limit:
+                    raise ExecuteError(cmd, "output exceeds %d bytes" % limit)
+                chunks.append(chunk)
+        finally:
+            process.close()
+        span.attributes['status'] = process.status
+    return (process.status, b''.join(chunks).decode('utf-8'))
+
+# Stream: Runs a shell command and delivers its output as it arrives {{{2
+ChunkSize = 4096
+
+def waitForStreams(readers, writers, timeout):
+    """
+    Wait until one of the readers is readable or one of the writers is
+    writable and return the lists of each that are ready.
+    """
+    try:
+        import selectors
+    except ImportError:
+        return select.select(readers, writers, [], timeout)[:2]
+    with selectors.DefaultSelector() as selector:
+        for fd in readers:
+            selector.register(fd, selectors.EVENT_READ)
+        for fd in writers:
+            selector.register(fd, selectors.EVENT_WRITE)
+        ready = selector.select(timeout)
+    return (
+        [key.fd for key, events in ready if events & selectors.EVENT_READ],
+        [key.fd for key, events in ready if events & selectors.EVENT_WRITE]
+    )
+
+class Stream(object):
+    """
+    Execute a command and iterate through its stdout in chunks of chunkSize
+    bytes (the last may be shorter) as the command produces it. Stdin is fed to
+    the command and stderr is collected at the same time, so the command never
+    blocks on a full pipe while we are waiting on another one.
+
+    Iterating raises an ExecuteError if the command runs for longer than
+    timeout seconds, if more than limit bytes of stderr or of stdout not yet
+    delivered accumulate, or if the exit status is not in accept (unless accept
+    is True). The command is killed if iteration stops early or close() is
+    called. Once iteration is complete, status holds the exit status.
+    """
+    def __init__(
+        self, cmd, stdin = '', accept = (0,), shell=True, chunkSize=ChunkSize,
+        timeout=None, limit=None
+    ):
+        import subprocess
+        self.cmd = cmd
+        self.stdin = stdin if type(stdin) is bytes else stdin.encode('utf-8')
+        self.accept = accept
+        self.chunkSize = chunkSize
+        self.timeout = timeout
+        self.limit = limit
+        self.status = None
+        self.stderr = b''
+        try:
+            self.process = subprocess.Popen(
+                cmd, shell=shell, close_fds=True,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+        except (IOError, OSError) as err:
+            raise ExecuteError(cmd, err.strerror, err.filename)
+
+    def __iter__(self):
+        import time, fcntl
+        process = self.process
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        pending = self.stdin
+        stdout = b''
+        readers = [process.stdout.fileno(), process.stderr.fileno()]
+        writers = [process.stdin.fileno()] if pending else []
+        for fd in readers + writers:
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        if not pending:
+            process.stdin.close()
+        try:
+            while readers:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise ExecuteError(
+                            self.cmd, "timed out after %s seconds" % self.timeout
+                        )
+                readable, writable = waitForStreams(readers, writers, remaining)
+                if writable:
+                    try:
+                        pending = pending[os.write(writers[0], pending):]
+                    except OSError as err:
+                        if err.errno == errno.EPIPE:
+                            pending = b''  # command will not read any more
+                        elif err.errno != errno.EAGAIN:
+                            raise
+                    if not pending:
+                        process.stdin.close()
+                        writers = []
+                for fd in readable:
+                    try:
+                        data = os.read(fd, self.chunkSize)
+                    except OSError as err:
+                        if err.errno == errno.EAGAIN:
+                            continue
+                        raise
+                    if not data:
+                        readers.remove(fd)
+                    elif fd == process.stdout.fileno():
+                        stdout += data
+                    else:
+                        self.stderr += data
+                if self.limit is not None and (
+                    max(len(stdout), len(self.stderr)) > self.limit
+                ):
+                    raise ExecuteError(
+                        self.cmd, "output exceeds %d bytes" % self.limit
+                    )
+                while len(stdout) >= self.chunkSize:
+                    yield stdout[:self.chunkSize]
+                    stdout = stdout[self.chunkSize:]
+            if stdout:
+                yield stdout
+            self.status = process.wait()
+        finally:
+            self.close()
+        if self.accept is not True and self.status not in self.accept:
+            stderr = self.stderr.decode('utf-8', 'replace').strip()
+            if stderr:
+                raise ExecuteError(self.cmd, stderr)
+            else:
+                raise ExecuteError(
+                    self.cmd, "unexpected exit status (%d)" % self.status
+                )
+
+    def close(self):
+        """
+        Kill the command if it is still running and close its streams.
+        """
+        process = self.process
+        if self.status is None and process.poll() is None:
+            process.kill()
+            process.wait()
+        for f in (process.stdin, process.stdout, process.stderr):
+            if not f.closed:
+                f.close()
 
 # Which: Search path for executable files with given name {{{2
 def which(name, flags=os.X_OK):
@@ -387,3 +628,197 @@ def which(name, flags=os.X_OK):
             result.append(p)
     return result
 
+
+# Find executable: cached search of PATH for an executable {{{2
+executables = {}
+
+def findExecutable(name):
+    """
+    Return the full path to the executable with the given name. The PATH is
+    only searched the first time each name is requested. Raise an ExecuteError
+    if no executable is found.
+    """
+    if os.path.sep in name:
+        return name
+    try:
+        return executables[name]
+    except KeyError:
+        found = which(name)
+        if not found:
+            raise ExecuteError(name, "command not found")
+        executables[name] = found[0]
+        return found[0]
+
+# Spawn: Start a command without a shell and keep track of it {{{2
+children = set()
+
+def spawn(cmd, **kwargs):
+    """
+    Start a command given as a list of arguments and return the Popen object.
+    The process is remembered until reap() is called on it so that it can be
+    stopped with terminateChildren(). Keyword arguments are passed to Popen.
+    """
+    import subprocess
+    with traced('spawn', command=commandLine(cmd)):
+        argv = [findExecutable(cmd[0])] + list(cmd[1:])
+        try:
+            process = subprocess.Popen(argv, close_fds=True, **kwargs)
+        except (IOError, OSError) as err:
+            raise ExecuteError(cmd, err.strerror, err.filename)
+    children.add(process)
+    return process
+
+def reap(process):
+    """
+    Wait for a process started with spawn() to exit and return its status.
+    """
+    status = process.wait()
+    children.discard(process)
+    return status
+
+def terminateChildren(sig=None):
+    """
+    Send a signal (SIGTERM by default) to every process started with spawn()
+    that has not yet been reaped.
+    """
+    import signal
+    for process in list(children):
+        try:
+            process.send_signal(sig or signal.SIGTERM)
+        except OSError:
+            pass
+
+# Pipeline: Runs commands connected by pipes without a shell {{{2
+class Pipeline(object):
+    """
+    Runs a sequence of commands, each given as a list of arguments, with the
+    output of each connected to the input of the next using os.pipe. The input
+    of the first stage and the output of the last may be given as file
+    objects or file descriptors, as may the error output shared by every
+    stage; by default they are inherited.
+
+    After wait() returns, statuses holds the exit status of each stage and
+    latencies holds, for each stage whose output goes to a pipe, the time in
+    seconds from starting the pipeline until the stage first produced output
+    (None if it produced none). Both are also recorded with the trace of the
+    pipeline (see trace).
+    """
+    def __init__(self, stages, stdin=None, stdout=None, stderr=None):
+        self.stages = [list(stage) for stage in stages]
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.processes = []
+        self.statuses = []
+        self.latencies = [None]*len(self.stages)
+
+    def start(self):
+        import threading, time
+        self.started = time.time()
+        stdin = self.stdin
+        probes = []
+        try:
+            for i, stage in enumerate(self.stages):
+                last = i == len(self.stages) - 1
+                if last:
+                    read, write = None, self.stdout
+                else:
+                    read, write = os.pipe()
+                    probes.append((i, os.dup(read)))
+                try:
+                    self.processes.append(
+                        spawn(
+                            stage, stdin=stdin, stdout=write,
+                            stderr=self.stderr
+                        )
+                    )
+                except ExecuteError:
+                    if not last:
+                        os.close(read)
+                    raise
+                finally:
+                    # the children hold their own copies of these
+                    if i:
+                        os.close(stdin)
+                    if not last:
+                        os.close(write)
+                stdin = read
+        except ExecuteError:
+            for i, fd in probes:
+                os.close(fd)
+            self.terminate()
+            for process in self.processes:
+                reap(process)
+            raise
+        if probes:
+            self.probe = threading.Thread(target=self.watch, args=(probes,))
+            self.probe.daemon = True
+            self.probe.start()
+        else:
+            self.probe = None
+        return self
+
+    def watch(self, probes):
+        # Wait for each pipe to become readable, without reading from it, to
+        # note when its stage first produced output. Each probe descriptor is
+        # closed as soon as it has served its purpose so it never keeps a
+        # pipe open after its reader has gone.
+        import select, time
+        probes = dict((fd, i) for i, fd in probes)
+        while probes:
+            try:
+                readable = select.select(list(probes), [], [], 1)[0]
+            except (select.error, ValueError):
+                break
+            for fd in readable:
+                self.latencies[probes.pop(fd)] = time.time() - self.started
+                os.close(fd)
+            if all(process.poll() is not None for process in self.processes):
+                break
+        for fd in probes:
+            os.close(fd)
+
+    def wait(self, accept=(0,)):
+        """
+        Wait for every stage to exit and return their exit statuses. Raise an
+        ExecuteError for the first stage whose status is not in accept, unless
+        accept is True.
+        """
+        with traced(
+            'pipeline', command=' | '.join(map(commandLine, self.stages))
+        ) as span:
+            self.statuses = [reap(process) for process in self.processes]
+            if self.probe:
+                self.probe.join()
+            span.attributes.update(
+                statuses=self.statuses, latencies=self.latencies
+            )
+        if accept is not True:
+            for stage, status in zip(self.stages, self.statuses):
+                if status not in accept:
+                    raise ExecuteError(
+                        stage, "unexpected exit status (%d)" % status
+                    )
+        return self.statuses
+
+    def run(self, accept=(0,)):
+        """
+        Start the pipeline and wait for it to finish.
+        """
+        self.start()
+        try:
+            return self.wait(accept)
+        except KeyboardInterrupt:
+            self.terminate()
+            raise
+
+    def terminate(self):
+        """
+        Ask every stage of the pipeline to exit.
+        """
+        for process in self.processes:
+            if process.poll() is None:
+                try:
+                    process.terminate()
+                except OSError:
+                    pass
@@ -0,0 +1,203 @@
+# Controls the fins (station and LEDs) by writing directly to the RadioSHARK HID
+# device through hidraw rather than running sharkctrl for every command. The
+# device is opened once and kept open. Related commands can be grouped into a
+# transaction, which sends them back to back. The time taken by each command
+# is recorded.
+#
+# The packets are the same as those sent by sharkctrl. If no hidraw device can
+# be found for a fin (or it cannot be opened), sharkctrl is used instead.
+
+# Imports {{{1
+from __future__ import division
+from fileutils import execute, ExecuteError
+from collections import deque
+import threading
+import time
+import os
+import re
+
+# Globals {{{1
+VendorId = 0x077d  # Griffin Technology
+ProductId = 0x627a # RadioSHARK
+PacketLength = 7
+HidrawClass = '/sys/class/hidraw'
+DeviceDirectory = '/dev'
+LatencyHistory = 100 # number of command latencies kept for each fin
+HidId = re.compile(r'HID_ID=[0-9A-Fa-f]+:([0-9A-Fa-f]+):([0-9A-Fa-f]+)')
+HidPhys = re.compile(r'HID_PHYS=(\S+)')
+
+# Packets {{{1
+def stationPacket(station):
+    """
+    Return the packet that tunes to station, given as sharkctrl arguments
+    ('-am 680' or '-fm 107.7').
+    """
+    band, freq = station.split()
+    if band == '-fm':
+        encoded = int((float(freq)*1000 + 10700)/12.5) + 3
+        return [0xC0, (encoded >> 8) & 0xFF, encoded & 0xFF, 0x33, 0x04]
+    elif band == '-am':
+        encoded = int(freq) + 450
+        return [0xC0, (encoded >> 8) & 0xFF, encoded & 0xFF, 0xF3, 0x36]
+    raise ValueError('%s: unknown band' % station)
+
+def bluePacket(level):
+    return [0xA0, int(level) & 0x7F]
+
+def redPacket(on):
+    return [0xA9 if int(on) else 0xA8]
+
+def encode(packet):
+    """
+    Pad a packet to full length and prefix it with the report number (0, the
+    RadioSHARK does not use numbered reports) as hidraw expects.
+    """
+    packet = packet + [0]*(PacketLength - len(packet))
+    return bytearray([0] + packet)
+
+# Find devices {{{1
+def findDevices(sysfs=HidrawClass, devices=DeviceDirectory):
+    """
+    Return the paths of the hidraw devices of the fins, ordered by their
+    physical location, which gives the order used by sharkctrl for its
+    addresses.
+    """
+    found = []
+    try:
+        names = os.listdir(sysfs)
+    except OSError:
+        return []
+    for name in names:
+        try:
+            with open(os.path.join(sysfs, name, 'device', 'uevent')) as f:
+                uevent = f.read()
+        except IOError:
+            continue
+        match = HidId.search(uevent)
+        if not match:
+            continue
+        ids = (int(match.group(1), 16), int(match.group(2), 16))
+        if ids != (VendorId, ProductId):
+            continue
+        phys = HidPhys.search(uevent)
+        found.append((
+            phys.group(1) if phys else name, os.path.join(devices, name)
+        ))
+    return [path for phys, path in sorted(found)]
+
+# Fin control {{{1
+class FinControl(object):
+    """
+    Base class for controlling a fin. Commands issued inside a transaction
+    are collected and sent together when the transaction ends.
+    """
+    def __init__(self, ctrlAddr):
+        self.ctrlAddr = ctrlAddr
+        self.lock = threading.RLock()
+        self.batch = None
+        self.latencies = deque(maxlen=LatencyHistory)
+
+    def station(self, station):
+        self.command('station %s' % station, stationPacket(station), station)
+
+    def blue(self, level):
+        self.command('blue %s' % level, bluePacket(level), '-blue %s' % level)
+
+    def red(self, on):
+        self.command('red %s' % on, redPacket(on), '-red %s' % on)
+
+    def command(self, name, packet, args):
+        with self.lock:
+            if self.batch is not None:
+                self.batch.append((name, packet, args))
+            else:
+                self.send([(name, packet, args)])
+
+    def transaction(self):
+        return Transaction(self)
+
+    def send(self, commands):
+        with self.lock:
+            for name, packet, args in commands:
+                start = time.time()
+                self.write(packet, args)
+                self.latencies.append((name, time.time() - start))
+
+    def report(self):
+        """
+        Return a summary of the time taken by recent commands.
+        """
+        if not self.latencies:
+            return 'fin %s: no commands sent.' % self.ctrlAddr
+        times = sorted(latency for name, latency in self.latencies)
+        return 'fin %s (%s): %d commands, median %.1f us, max %.1f us.' % (
+            self.ctrlAddr, self.kind, len(times),
+            1e6*times[len(times)//2], 1e6*times[-1]
+        )
+
+class Transaction(object):
+    def __init__(self, control):
+        self.control = control
+
+    def __enter__(self):
+        self.control.lock.acquire()
+        self.control.batch = []
+        return self.control
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        batch, self.control.batch = self.control.batch, None
+        try:
+            if exc_type is None and batch:
+                self.control.send(batch)
+        finally:
+            self.control.lock.release()
+
+class HidControl(FinControl):
+    """
+    Controls a fin by writing packets to its hidraw device, which is kept open.
+    """
+    kind = 'hidraw'
+
+    def __init__(self, ctrlAddr, path):
+        FinControl.__init__(self, ctrlAddr)
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY)
+
+    def write(self, packet, args):
+        try:
+            os.write(self.fd, encode(packet))
+        except OSError as err:
+            raise ExecuteError(self.path, err.strerror)
+
+    def close(self):
+        os.close(self.fd)
+
+class ShellControl(FinControl):
+    """
+    Controls a fin by running sharkctrl.
+    """
+    kind = 'sharkctrl'
+
+    def write(self, packet, args):
+        execute('sharkctrl %s %s' % (args, self.ctrlAddr))
+
+    def close(self):
+        pass
+
+# Open fin {{{1
+controls = {}
+controlsLock = threading.Lock()
+
+def control(fin):
+    """
+    Return the control for a fin (from fins.py), opening it on first use.
+    """
+    with controlsLock:
+        if fin.ctrlAddr not in controls:
+            devices = findDevices()
+            try:
+                path = devices[int(fin.ctrlAddr)]
+                controls[fin.ctrlAddr] = HidControl(fin.ctrlAddr, path)
+            except (IndexError, ValueError, OSError):
+                controls[fin.ctrlAddr] = ShellControl(fin.ctrlAddr)
+        return controls[fin.ctrlAddr]
@@ -1,3 +1,6 @@
+import json
+import os
+
 class Info():
     def __init__(self, **kwargs):
         self.__dict__ = kwargs
@@ -14,10 +17,27 @@ class Info():
 #     listen to a particular audioAddr while using the shark control program to
 #     change the channel and change the color of the fin.
 #     control program 
+# bands (optional):
+#     The bands the fin can receive, for example ['fm'] if it has no AM antenna.
+#     Defaults to both. Used by sharkd.py when it assigns games to fins (see
+#     allocate.py).
 # This information is subject to change if you change the USB socket that the
-# fin uses or if you reboot the machine.
+# fin uses or if you reboot the machine. Rather than finding it by hand, you
+# can run 'discover.py --write' (or start sharkd.py with --discover), which
+# finds the audioAddr of each fin automatically and saves it in
+# DiscoveredAddrs, which overrides the addresses given below.
 
 fins = {
     'baseball': Info(audioAddr='hw:2,0', ctrlAddr='0'),
     'football': Info(audioAddr='hw:1,0', ctrlAddr='1')
 }
+
+# Addresses saved by discover.py override those given above.
+DiscoveredAddrs = '~/.radioshark-fins.json'
+try:
+    with open(os.path.expanduser(DiscoveredAddrs)) as f:
+        for name, addrs in json.load(f).items():
+            if name in fins:
+                fins[name].__dict__.update(addrs)
+except (IOError, ValueError):
+    pass
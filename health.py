@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# Watches the recordings in progress. As a game is captured, the recorder
+# counts the bytes read from the fin, the bytes passed to the encoder, the time
+# spent waiting for the encoder to take them, and the overruns reported by
+# arecord. Every few seconds a reporter thread turns these counts into rates,
+# checks that the output file is still growing, and warns when a capture
+# stalls or an encoder falls behind. If given a path, it also writes the
+# figures to that file in the Prometheus text format, where they can be picked
+# up by the textfile collector of the node exporter or simply read by hand.
+#
+# Usage:
+#     health.py [<path>]
+# Prints the figures last written to the given file (the default is
+# Metrics below).
+
+# Imports {{{1
+from __future__ import division
+import threading
+import time
+import sys
+import re
+import os
+
+# Globals {{{1
+Metrics = '~/.radioshark.prom' # default metrics file
+Interval = 5 # seconds between reports
+StallTime = 10 # seconds without audio from the fin before the capture is
+               # considered stalled
+GrowthTime = 120 # seconds without the output file growing before the
+                 # encoder is considered stalled (encoders buffer a few
+                 # seconds of output, more at low bit rates)
+SlowRatio = 0.5 # fraction of the time spent waiting for the encoder beyond
+                # which it is considered to be falling behind
+MaxBacklog = 30 # seconds of audio waiting for the encoder (pre-roll capture)
+                # beyond which it is considered to be falling behind
+XrunMessage = re.compile(r'overrun|underrun|xrun', re.IGNORECASE)
+
+meters = {} # meters of the recordings in progress, by team and filename
+lock = threading.Lock()
+
+# Meter {{{1
+class Meter(object):
+    """
+    Counts the audio that flows through the capture of one game. The capture
+    calls read() as audio arrives from the fin and write() to pass it to the
+    encoder; arecord's overruns are counted with xrun().
+    """
+    def __init__(self, game, team):
+        self.labels = (
+            ('fin', team.fin), ('team', team.name), ('game', game['filename'])
+        )
+        self.name = game['filename']
+        self.key = (team.name, game['filename'])
+        self.bytesPerSecond = None # expected rate of the audio from the fin
+        self.output = None # has a path attribute that gives the file written
+        self.backlog = None # function that returns the seconds of audio queued
+        self.counted = True # false if the audio does not pass through Python
+                            # (arecord piped straight into the encoder)
+        self.captured = 0
+        self.written = 0
+        self.waited = 0.0
+        self.xruns = 0
+        self.began = self.lastCapture = time.time()
+        self.previous = None # counts at the last report
+        self.lastGrowth = self.began
+        self.reportedXruns = 0
+        self.conditions = set() # conditions currently flagged
+
+    def read(self, size):
+        self.captured += size
+        self.lastCapture = time.time()
+
+    def write(self, output, data):
+        began = time.time()
+        output.write(data)
+        self.waited += time.time() - began
+        self.written += len(data)
+
+    def xrun(self):
+        self.xruns += 1
+
+    def outputFile(self):
+        """
+        Return the path and size of the file being written.
+        """
+        path = getattr(self.output, 'path', None)
+        try:
+            return path, os.path.getsize(path)
+        except (TypeError, OSError):
+            return path, 0
+
+def register(meter, began=None):
+    """
+    Start watching a recording that begins at began (now by default). The
+    meter may have been made well before, while the fin was warming up.
+    """
+    meter.began = meter.lastCapture = meter.lastGrowth = began or time.time()
+    with lock:
+        meters[meter.key] = meter
+
+def unregister(meter):
+    with lock:
+        if meters.get(meter.key) is meter:
+            del meters[meter.key]
+
+# Watch errors {{{1
+def watchErrors(stream, onXrun):
+    """
+    Read the error output of arecord in a thread, calling onXrun for each
+    overrun it reports and passing everything else on to stderr.
+    """
+    def watch():
+        for line in iter(stream.readline, b''):
+            if XrunMessage.search(line):
+                onXrun()
+            else:
+                sys.stderr.write(line)
+        stream.close()
+    watcher = threading.Thread(target=watch, name='errors')
+    watcher.daemon = True
+    watcher.start()
+    return watcher
+
+# Measure {{{1
+def measure(meter, now):
+    """
+    Return the figures for a recording since the previous call as a
+    dictionary, and the conditions that need attention.
+    """
+    path, size = meter.outputFile()
+    current = (now, meter.captured, meter.written, meter.waited, path, size)
+    if meter.previous is None:
+        meter.previous = (meter.began, 0, 0, 0.0, path, 0)
+    then, captured, written, waited, lastPath, lastSize = meter.previous
+    meter.previous = current
+    elapsed = max(now - then, 1e-3)
+    if path != lastPath:
+        lastSize = 0 # moved on to the next segment
+    if size != lastSize or path != lastPath:
+        meter.lastGrowth = now
+    figures = {
+        'captureRate': (meter.captured - captured)/elapsed
+      , 'writeRate': (meter.written - written)/elapsed
+      , 'waitRatio': min((meter.waited - waited)/elapsed, 1)
+      , 'growthRate': max(size - lastSize, 0)/elapsed
+      , 'backlog': meter.backlog() if meter.backlog else 0
+      , 'outputBytes': size
+    }
+    conditions = set()
+    if meter.counted and now - meter.lastCapture > StallTime:
+        conditions.add('stalled')
+    # once flagged, an encoder must do markedly better before it is cleared so
+    # that the warning does not come and go with each block of audio
+    relief = 2 if 'slow' in meter.conditions else 1
+    if (
+        figures['waitRatio'] > SlowRatio/relief or
+        figures['backlog'] > MaxBacklog/relief
+    ):
+        conditions.add('slow')
+    if now - meter.lastGrowth > GrowthTime:
+        conditions.add('idle')
+    if meter.xruns > meter.reportedXruns:
+        conditions.add('xrun')
+    meter.reportedXruns = meter.xruns
+    return figures, conditions
+
+Warnings = {
+    'stalled': '%(game)s: capture stalled, no audio from the fin for %(since)d seconds.'
+  , 'slow': '%(game)s: encoder is falling behind (waiting %(wait)d%% of the time, %(backlog).0f seconds queued).'
+  , 'idle': '%(game)s: %(path)s has not grown for %(idle)d seconds.'
+  , 'xrun': '%(game)s: %(xruns)d overruns reported by arecord so far.'
+}
+Recoveries = {
+    'stalled': '%(game)s: capture has resumed.'
+  , 'slow': '%(game)s: encoder has caught up.'
+  , 'idle': '%(game)s: %(path)s is growing again.'
+}
+
+def announce(meter, figures, conditions, now):
+    """
+    Print a warning as each condition arises and a note when it clears.
+    Overruns are reported whenever more occur.
+    """
+    values = {
+        'game': meter.name
+      , 'since': now - meter.lastCapture
+      , 'wait': 100*figures['waitRatio']
+      , 'backlog': figures['backlog']
+      , 'path': meter.previous[4]
+      , 'idle': now - meter.lastGrowth
+      , 'xruns': meter.xruns
+    }
+    for condition in sorted(conditions - meter.conditions - set(['xrun'])):
+        print 'Warning: ' + Warnings[condition] % values
+    if 'xrun' in conditions:
+        print 'Warning: ' + Warnings['xrun'] % values
+    for condition in sorted(meter.conditions - conditions):
+        if condition in Recoveries:
+            print Recoveries[condition] % values
+    meter.conditions = conditions
+
+# Report {{{1
+# name, type, help, and how to find the value from the meter and its figures
+Series = [
+    ('captured_bytes_total', 'counter', 'Bytes of audio read from the fin.',
+        lambda meter, figures: meter.captured)
+  , ('written_bytes_total', 'counter', 'Bytes of audio passed to the encoder.',
+        lambda meter, figures: meter.written)
+  , ('xruns_total', 'counter', 'Overruns reported by arecord.',
+        lambda meter, figures: meter.xruns)
+  , ('capture_bytes_per_second', 'gauge', 'Rate at which audio is read from the fin.',
+        lambda meter, figures: figures['captureRate'])
+  , ('capture_ratio', 'gauge', 'Rate at which audio is read relative to the rate the fin produces it.',
+        lambda meter, figures: figures['captureRate']/meter.bytesPerSecond if meter.bytesPerSecond else 0)
+  , ('write_bytes_per_second', 'gauge', 'Rate at which audio is passed to the encoder.',
+        lambda meter, figures: figures['writeRate'])
+  , ('encoder_wait_ratio', 'gauge', 'Fraction of the time spent waiting for the encoder to take audio.',
+        lambda meter, figures: figures['waitRatio'])
+  , ('encoder_backlog_seconds', 'gauge', 'Seconds of audio queued for the encoder.',
+        lambda meter, figures: figures['backlog'])
+  , ('output_bytes', 'gauge', 'Size of the file being written.',
+        lambda meter, figures: figures['outputBytes'])
+  , ('output_growth_bytes_per_second', 'gauge', 'Rate at which the file being written grows.',
+        lambda meter, figures: figures['growthRate'])
+  , ('elapsed_seconds', 'gauge', 'Time since the recording started.',
+        lambda meter, figures: max(time.time() - meter.began, 0))
+  , ('stalled', 'gauge', '1 if no audio has arrived from the fin recently.',
+        lambda meter, figures: int('stalled' in meter.conditions))
+  , ('encoder_slow', 'gauge', '1 if the encoder is falling behind.',
+        lambda meter, figures: int('slow' in meter.conditions))
+  , ('output_idle', 'gauge', '1 if the file being written has stopped growing.',
+        lambda meter, figures: int('idle' in meter.conditions))
+]
+
+def formatLabels(labels):
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in labels
+    )
+
+def report(path=None, now=None):
+    """
+    Measure each recording in progress, announce any conditions that need
+    attention, and write the figures to path (if given). Returns the text
+    written.
+    """
+    now = now or time.time()
+    with lock:
+        current = sorted(meters.values(), key=lambda meter: meter.key)
+    measured = []
+    for meter in current:
+        figures, conditions = measure(meter, now)
+        announce(meter, figures, conditions, now)
+        measured.append((meter, figures))
+    lines = [
+        '# HELP radioshark_recordings Recordings in progress.'
+      , '# TYPE radioshark_recordings gauge'
+      , 'radioshark_recordings %d' % len(measured)
+      , '# HELP radioshark_report_timestamp_seconds Time of this report.'
+      , '# TYPE radioshark_report_timestamp_seconds gauge'
+      , 'radioshark_report_timestamp_seconds %.3f' % now
+    ]
+    for name, kind, description, value in Series:
+        if not measured:
+            break
+        lines += [
+            '# HELP radioshark_%s %s' % (name, description)
+          , '# TYPE radioshark_%s %s' % (name, kind)
+        ]
+        for meter, figures in measured:
+            number = value(meter, figures)
+            lines.append('radioshark_%s%s %s' % (
+                name, formatLabels(meter.labels),
+                number if isinstance(number, (int, long)) else '%.6g' % number
+            ))
+    text = '\n'.join(lines) + '\n'
+    if path:
+        # write under a temporary name and rename so readers never see a
+        # partial report
+        temp = path + '.tmp'
+        try:
+            with open(temp, 'w') as f:
+                f.write(text)
+            os.rename(temp, path)
+        except (IOError, OSError) as err:
+            print '%s: %s.' % (err.filename or path, err.strerror)
+    return text
+
+class Reporter(threading.Thread):
+    """
+    Reports on the recordings in progress every interval seconds.
+    """
+    def __init__(self, path=None, interval=Interval):
+        threading.Thread.__init__(self, name='health')
+        self.daemon = True
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            report(self.path)
+        report(self.path)
+
+    def stop(self):
+        self.stopped.set()
+
+# Main {{{1
+if __name__ == '__main__':
+    from fileutils import expandPath
+    import argparse
+    clp = argparse.ArgumentParser(description="Show the health of the recordings in progress.")
+    clp.add_argument('path', nargs='?', default=Metrics, help="metrics file written by the daemon (default %(default)s)")
+    args = clp.parse_args()
+    path = expandPath(args.path)
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+        age = time.time() - os.path.getmtime(path)
+    except (IOError, OSError) as err:
+        sys.exit('%s: %s.' % (path, err.strerror))
+    for line in lines:
+        if not line.startswith('#'):
+            print line
+    if age > 3*Interval:
+        print '# Warning: last written %d seconds ago.' % age
@@ -0,0 +1,161 @@
+# Streaming reader for vCalendar (ICS) files. Reads the file a line at a time
+# and yields the events one at a time, so memory use does not grow with the
+# size of the calendar. Only the properties that are asked for are kept.
+
+# Imports {{{1
+import calendar
+import re
+
+# Globals {{{1
+DateTime = re.compile(r'^(\d{4})(\d{2})(\d{2})(?:T(\d{2})(\d{2})(\d{2})(Z?))?$')
+TimeProperties = ('DTSTART', 'DTEND', 'DTSTAMP', 'RECURRENCE-ID')
+
+class IcsError(Exception):
+    def __init__(self, filename, lineno, error):
+        self.filename = filename
+        self.lineno = lineno
+        self.error = error
+
+    def __str__(self):
+        return "%s,%d: %s." % (self.filename, self.lineno, self.error)
+
+# Unfold {{{1
+def unfold(lines):
+    """
+    Join folded lines (a line that starts with a space or tab continues the
+    previous line). Yields (line number, logical line) pairs.
+    """
+    current = None
+    start = 0
+    for lineno, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current = line
+        start = lineno
+    if current is not None:
+        yield start, current
+
+# Split content line {{{1
+def splitLine(line):
+    """
+    Split a content line into its name, its parameters (as a dictionary) and
+    its value. Returns None if the line is not a content line.
+    """
+    quoted = False
+    for i, c in enumerate(line):
+        if c == '"':
+            quoted = not quoted
+        elif c == ':' and not quoted:
+            break
+    else:
+        return None
+    head, value = line[:i], line[i+1:]
+    fields = head.split(';')
+    params = {}
+    for field in fields[1:]:
+        key, _, val = field.partition('=')
+        params[key.upper()] = val.strip('"')
+    return fields[0].upper(), params, value
+
+# Convert values {{{1
+def unescape(text):
+    """
+    Undo the escaping used in TEXT values.
+    """
+    if '\\' not in text:
+        return text
+    return re.sub(
+        r'\\(.)'
+      , lambda m: '\n' if m.group(1) in 'nN' else m.group(1)
+      , text
+    )
+
+def toTimestamp(value, params, timezone):
+    """
+    Convert a DATE or DATE-TIME value into seconds since the epoch. Values in
+    UTC end with Z, others are in the time zone given by the TZID parameter or,
+    if there is none, by timezone (the name of a time zone known to pytz).
+    """
+    match = DateTime.match(value)
+    if not match:
+        raise ValueError('%s: invalid date' % value)
+    year, month, day, hour, minute, second, utc = match.groups()
+    fields = [int(year), int(month), int(day)]
+    fields += [int(hour), int(minute), int(second)] if hour else [0, 0, 0]
+    if utc:
+        return calendar.timegm(fields + [0, 0, 0])
+    import pytz
+    import datetime
+    zone = pytz.timezone(params.get('TZID', timezone))
+    local = zone.localize(datetime.datetime(*fields))
+    return calendar.timegm(local.utctimetuple())
+
+# Read events {{{1
+def readEvents(
+    lines, properties=('DTSTART', 'SUMMARY'), since=None, until=None,
+    timezone='UTC', filename='<ics>'
+):
+    """
+    Yield a dictionary for each VEVENT found in lines (any iterable of lines,
+    such as an open file) that contains the requested properties. Times are
+    converted to seconds since the epoch and text is unescaped. Events that
+    start before since are skipped. Reading stops at the first event that
+    starts at or after until, so only use until with calendars whose events
+    are in chronological order. Properties of components nested inside an
+    event (such as VALARM) are ignored.
+    """
+    wanted = set(properties) | set(['DTSTART'])
+    event = None
+    depth = 0
+    for lineno, line in unfold(lines):
+        if not line:
+            continue
+        split = splitLine(line)
+        if not split:
+            raise IcsError(filename, lineno, 'not a content line')
+        name, params, value = split
+        if name == 'BEGIN':
+            if event is not None:
+                depth += 1
+            elif value.upper() == 'VEVENT':
+                event = {}
+                depth = 0
+            continue
+        if name == 'END':
+            if event is None:
+                continue
+            if depth:
+                depth -= 1
+                continue
+            if value.upper() == 'VEVENT':
+                if 'DTSTART' not in event:
+                    raise IcsError(filename, lineno, 'event has no DTSTART')
+                start = event['DTSTART']
+                if until is not None and start >= until:
+                    return
+                if since is None or start >= since:
+                    yield event
+                event = None
+            continue
+        if event is None or depth or name not in wanted:
+            continue
+        if name in TimeProperties:
+            try:
+                event[name] = toTimestamp(value, params, timezone)
+            except (ValueError, KeyError) as err:
+                raise IcsError(filename, lineno, str(err))
+        else:
+            event[name] = unescape(value)
+
+def readFile(filename, **kwargs):
+    """
+    Yield the events contained in an ICS file (see readEvents).
+    """
+    import io
+    with io.open(filename, encoding='utf-8', errors='replace') as f:
+        for event in readEvents(f, filename=filename, **kwargs):
+            yield event
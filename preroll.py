@@ -0,0 +1,138 @@
+# Always-on capture of a fin. The most recent few minutes of audio from the fin
+# are kept in a fixed size ring buffer so that when a recording starts it can
+# include the audio from before its scheduled start (in case the schedule is a
+# little off or the pre-game show starts early). The audio is kept downmixed and
+# resampled to the rate of the encoder, so little memory and CPU is used while
+# idle. Requires numpy.
+
+# Imports {{{1
+from __future__ import division
+from recorder import buildRecorder, setStation, BlockSize
+from fileutils import ExecuteError, spawn, reap
+import health
+import threading
+import Queue
+import mmap
+import time
+from subprocess import PIPE
+
+# Ring buffer {{{1
+class RingBuffer(object):
+    """
+    A fixed size buffer in anonymous shared memory that holds the last size
+    bytes written to it.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.buffer = mmap.mmap(-1, size)
+        self.position = 0
+        self.filled = 0
+
+    def write(self, data):
+        if len(data) >= self.size:
+            data = data[len(data) - self.size:]
+        first = min(len(data), self.size - self.position)
+        self.buffer[self.position:self.position+first] = data[:first]
+        rest = len(data) - first
+        self.buffer[0:rest] = data[first:]
+        self.position = (self.position + len(data)) % self.size
+        self.filled = min(self.size, self.filled + len(data))
+
+    def read(self):
+        """
+        Return the contents of the buffer, oldest byte first.
+        """
+        if self.filled < self.size:
+            return self.buffer[0:self.filled]
+        return self.buffer[self.position:] + self.buffer[:self.position]
+
+# Pre-roll {{{1
+class PreRoll(threading.Thread):
+    """
+    Continuously captures a fin into a ring buffer that holds the last minutes
+    of audio, mono at the given rate. While a recording is attached, the live
+    audio is also passed to the recording through a queue, so a slow encoder
+    never holds up the capture.
+    """
+    RestartDelay = 10 # seconds to wait before restarting a failed capture
+
+    def __init__(self, fin, station, rate, minutes):
+        threading.Thread.__init__(self, name='preroll %s' % fin.audioAddr)
+        self.daemon = True
+        self.fin = fin
+        self.station = station
+        self.rate = rate
+        self.ring = RingBuffer(2*int(60*minutes*rate))
+        self.command = buildRecorder(fin)
+        self.lock = threading.Lock()
+        self.live = None
+        self.meter = None
+        self.xruns = 0
+        self.stopped = False
+        self.source = None
+
+    def attach(self, meter=None):
+        """
+        Return the audio held in the ring buffer and a queue that receives
+        the live audio from this point on. A None in the queue indicates that
+        the capture has stopped. Overruns are also counted by meter, if given,
+        while attached.
+        """
+        with self.lock:
+            self.live = Queue.Queue()
+            self.meter = meter
+            return self.ring.read(), self.live
+
+    def detach(self):
+        with self.lock:
+            self.live = None
+            self.meter = None
+
+    def xrun(self):
+        with self.lock:
+            self.xruns += 1
+            if self.meter:
+                self.meter.xrun()
+
+    def stop(self):
+        self.stopped = True
+        if self.source:
+            try:
+                self.source.kill()
+            except OSError:
+                pass
+
+    def run(self):
+        from dsp import Converter
+        try:
+            setStation(self.fin, self.station)
+        except ExecuteError as err:
+            print 'preroll: %s' % err
+        while not self.stopped:
+            converter = Converter(self.rate)
+            try:
+                self.source = spawn(self.command, stdout=PIPE, stderr=PIPE)
+            except ExecuteError as err:
+                print 'preroll: %s' % err
+                time.sleep(self.RestartDelay)
+                continue
+            health.watchErrors(self.source.stderr, self.xrun)
+            while True:
+                data = self.source.stdout.read(BlockSize)
+                if not data:
+                    break
+                data = converter.convert(data)
+                with self.lock:
+                    self.ring.write(data)
+                    if self.live:
+                        self.live.put(data)
+            self.source.stdout.close()
+            status = reap(self.source)
+            with self.lock:
+                if self.live:
+                    self.live.put(None)
+            if not self.stopped:
+                print 'preroll: %s: unexpected exit status (%d).' % (
+                    self.command[0], status
+                )
+                time.sleep(self.RestartDelay)
@@ -0,0 +1,1014 @@
+# Records a game from a fin. Shared by the recording daemons.
+
+# Imports {{{1
+from fins import fins, Info
+from fileutils import (
+    makePath, expandPath, ExecuteError, remove, mkdir, Pipeline, spawn, reap
+)
+from clock import sleepUntil
+from schedule import recordingLength
+from finctrl import control
+import archive
+import health
+import timing
+import retention
+import sqlite3
+import threading
+import select
+import time
+import sys
+import os
+
+# Configuration {{{1
+Extension = 30 # minutes added to the recordings in progress by extend()
+Capture = 'pipe' # choose from 'pipe' (arecord piped into the encoder), 'dsp'
+                 # (downmix and resample in-process, requires numpy) or
+                 # 'deferred' (capture to Intermediate, encode after the game)
+Intermediate = 'flac' # format of the recording made during the game when
+                      # Capture is 'deferred', choose from 'flac' or 'raw'
+Workers = None # number of encoders run at once when encoding after the game
+               # (None runs one per CPU)
+TrimSilence = False # remove long stretches of dead air (see silence.py) when
+                    # encoding after the game, requires numpy
+SegmentLength = None # split recordings into segments of this many seconds
+                     # (None records each game into a single file)
+WarmUp = 30 # seconds before the start of a game to tune the fin and prepare
+PreSpawn = 2 # seconds before the start of a game to start the recorder (and
+             # the encoder, unless arecord is piped straight into it); the
+             # audio captured before the start is discarded so the recording
+             # begins at the scheduled instant (0 starts them at the
+             # scheduled time)
+
+# Fin control {{{1
+def setStation(fin, station):
+    """
+    Tune the fin to a station.
+    """
+    control(fin).station(station)
+
+def tuneFin(fin, station):
+    """
+    Set the station and turn the fin red to indicate recording.
+    """
+    with control(fin).transaction() as shark:
+        shark.station(station)
+        shark.blue(0)
+        shark.red(1)
+
+def releaseFin(fin):
+    """
+    Turn the fin back to blue to indicate not recording.
+    """
+    with control(fin).transaction() as shark:
+        shark.red(0)
+        shark.blue(63)
+
+# Build the recorder {{{1
+def buildRecorder(fin, duration=None):
+    """
+    Return the arecord command (as a list of arguments) that captures the
+    output of the fin as raw 44.1kHz 16 bit stereo audio. If duration is None
+    the capture runs until arecord is killed.
+    """
+    if duration is None:
+        limit = []
+    else:
+        limit = [
+            '-d', str(3600*duration)     # recording time
+          , '--max-file-time', str(3600*duration)
+                                         # recording time before switching files (must be >= recording time)
+        ]
+    return [
+        'arecord'                        # audio recorder
+      , '-q'                             # quiet
+    ] + limit + [
+        '-c', '2'                        # input stream is 2 channels
+      , '-f', 'S16'                      # input stream is 16 bit signed
+      , '-r', '44100'                    # rate of input stream is 44.1kHz
+      , '-D', fin.audioAddr              # audio generator
+      , '-t', 'raw'                      # output format is raw (don't use .wav, it cuts out after 3 hours and 22 minutes because of a size limit on .wav files)
+    ]
+
+# Build the encoder {{{1
+# When rate is None the encoder reads the 44.1kHz stereo stream directly from
+# arecord and does its own downmixing and resampling. Otherwise the stream has
+# already been reduced to mono at the given rate (see dsp.py).
+EncoderRates = {'ogg': 8000, 'mp3': 8000, 'spx': 16000}
+
+def buildEncoder(game, team, filename, rate=None):
+    """
+    Return the encoder command (as a list of arguments) that reads raw audio
+    from its standard input and writes the recording to filename.
+    """
+    title = game['desc']
+    artist = team.artist
+    date = game['date']
+    if team.encoder == 'ogg':
+        if rate:
+            input = [
+                '--raw-chan=1'           # input stream is mono
+              , '--raw-rate=%d' % rate   # rate of input stream
+            ]
+        else:
+            input = [
+                '--resample', '8000'     # sample rate (8000 and 11025 are suitable choices for AM radio)
+              , '--downmix'              # convert from stereo to mono
+            ]
+        return [
+            'oggenc'                     # Ogg encoder
+          , '-Q'                         # quiet
+          , '-r'                         # input format is raw
+        ] + input + [
+            '-q', '0'                    # quality level (range is -1 to 10 with 10 being highest)
+          , '--ignorelength'             # Allow input stream to exceed 4GB
+          , '-o', filename               # output file name
+          , '--title', '%s (%s)' % (title, date)
+                                         # title
+          , '--album', title             # album
+          , '--artist', artist           # artist
+          , '--date', date               # date
+          , '-'                          # read from standard input
+        ]
+    elif team.encoder == 'mp3':
+        # Still not happy with the lame options. The ones below provide a
+        # reasonable filesize, but the recording sounds very tinny, removing the
+        # results in a nice sounding recording, but the files are a factor of
+        # two too large.
+        if rate:
+            input = [
+                '-r'                     # input format is raw
+              , '-s', '%g' % (rate/1000.0)
+                                         # rate of input stream in kHz
+              , '-m', 'm'                # input stream is mono
+              , '--bitwidth', '16'       # input stream is 16 bit
+              , '--signed'               # input stream is signed
+              , '--little-endian'        # input stream is little endian
+            ]
+        else:
+            input = [
+                '--resample', '8'        # resample to rate
+            ]
+        return [
+            'lame'
+          , '--quiet'               # quiet
+        ] + input + [
+            '-V3'                   # ???
+          , '--vbr-new'             # ???
+          , '-q0'                   # quality level
+          , '-B16'                  # maximum bit rate
+          , '--lowpass', '15.4'     # apply lowpass filter
+          , '--athaa-sensitivity', '1'
+                                    # ???
+          , '--tt', title           # title
+          , '--ta', artist          # artist
+          , '-'                     # read from standard input
+          , filename                # write to filename
+        ]
+    elif team.encoder == 'spx':
+        # This generates files that sound a little better than the ogg files but
+        # are much larger (odd because it is based on ogg and it tailored for
+        # the spoken word, perhaps it is because I cannot get the -vbr option to
+        # work). I am using the wideband option because it sounded
+        # better and took less space than the narrowband option.
+        if rate:
+            input = [
+                '--rate', str(rate)      # rate of input stream
+              , '--16bit'                # 16 bit raw input stream
+              , '--le'                   # little endian input stream
+            ]
+        else:
+            input = [
+              #  '--16bit'               # 16 bit raw input stream
+              #, '--le'                  # little endian input stream
+              #, '--stereo'              # stereo input stream
+            ]
+        return [
+            'speexenc'
+          , '-w'                    # wideband
+        ] + input + [
+            '--title', title        # title
+          , '--author', artist      # artist
+          , '-'                     # read from standard input
+          , filename                # write to filename
+        ]
+    else:
+        raise AssertionError("%s: Unknown encoder" % team.encoder)
+
+# Build the intermediate {{{1
+# With deferred capture the game is first recorded in a lossless format that
+# takes little CPU to write, and is encoded into the delivery formats after the
+# game. Raw intermediates take no CPU at all but need 635MB per hour (or 58MB
+# per hour at 8kHz mono), FLAC roughly halves that.
+
+def buildIntermediate(filename, rate=None):
+    """
+    Return the command (as a list of arguments) that compresses raw audio read
+    from its standard input into a FLAC intermediate. If rate is None the input
+    is the 44.1kHz stereo stream from the fin, otherwise it is mono at rate.
+    """
+    return [
+        'flac'
+      , '--silent'                  # quiet
+      , '-0'                        # fastest compression
+      , '--force-raw-format'        # input format is raw
+      , '--endian=little'           # input stream is little endian
+      , '--sign=signed'             # input stream is signed
+      , '--bps=16'                  # input stream is 16 bit
+      , '--channels=%d' % (1 if rate else 2)
+                                    # number of channels in input stream
+      , '--sample-rate=%d' % (rate or 44100)
+                                    # rate of input stream
+      , '--output-name', filename   # output file name
+      , '-'                         # read from standard input
+    ]
+
+def buildDecoder(filename):
+    """
+    Return the command (as a list of arguments) that decodes a FLAC
+    intermediate into raw audio on its standard output.
+    """
+    return [
+        'flac'
+      , '--silent'                  # quiet
+      , '--decode'                  # decode
+      , '--stdout'                  # write to standard output
+      , '--force-raw-format'        # output format is raw
+      , '--endian=little'           # output stream is little endian
+      , '--sign=signed'             # output stream is signed
+      , filename                    # read from filename
+    ]
+
+# Recording length {{{1
+class Length(object):
+    """
+    The length of a recording, which may be extended while the recording is in
+    progress (the capture checks it as each block of audio arrives, or, when
+    arecord is piped straight into the encoder, a LengthTimer checks it).
+    """
+    def __init__(self, hours):
+        self.lock = threading.Lock()
+        self.seconds = 3600*hours
+        self.began = None
+
+    def start(self, when=None):
+        self.began = when or time.time()
+
+    def extend(self, seconds):
+        with self.lock:
+            self.seconds += seconds
+
+    def end(self):
+        """
+        Return the time at which the recording is to end (seconds since the
+        epoch).
+        """
+        with self.lock:
+            return self.began + self.seconds
+
+    def hours(self):
+        return self.seconds/3600.0
+
+    def bytes(self, rate, frameBytes):
+        """
+        Return the size of the recording in bytes for the given sample rate
+        and bytes per frame.
+        """
+        return frameBytes*int(self.seconds*rate)
+
+recordings = {} # lengths of the recordings in progress, by team and filename
+
+def extend(minutes=None, filename=None):
+    """
+    Lengthen the recordings in progress (or only the recording of the game
+    with the given filename) by minutes (Extension by default). Returns the
+    filenames of the games whose recordings were extended.
+    """
+    extended = []
+    for (teamName, name), length in sorted(recordings.items()):
+        if filename is None or name == filename:
+            length.extend(60*(minutes or Extension))
+            extended.append(name)
+    return extended
+
+# Encoder output {{{1
+class Output(object):
+    """
+    Feeds audio to the encoder. If segmentBytes is given, the stream is split
+    into segments of that many bytes, each encoded by its own encoder process
+    into its own file. A segment is written under a temporary name and renamed
+    once its encoder has exited, so every file with its final name is complete.
+    The names of the finished segments are appended to a playlist.
+    """
+    def __init__(self, buildCommand, filename, segmentBytes=None):
+        self.buildCommand = buildCommand
+        self.filename = filename
+        self.segmentBytes = segmentBytes
+        self.root, self.ext = os.path.splitext(filename)
+        self.playlist = self.root + '.m3u' if segmentBytes else None
+        self.index = 0
+        self.process = None
+        self.path = None # file being written
+
+    def segmentName(self):
+        if self.segmentBytes:
+            return '%s-%03d%s' % (self.root, self.index, self.ext)
+        return self.filename
+
+    def start(self):
+        from subprocess import PIPE
+        if self.playlist and not self.index:
+            open(self.playlist, 'w').close()
+        self.index += 1
+        self.current = self.segmentName()
+        if self.segmentBytes:
+            self.partial = self.current + '.part'
+        else:
+            self.partial = self.current
+        self.path = self.partial
+        self.command = self.buildCommand(self.partial)
+        self.process = spawn(self.command, stdin=PIPE)
+        self.written = 0
+
+    def write(self, data):
+        while data:
+            if not self.process:
+                self.start()
+            room = len(data)
+            if self.segmentBytes:
+                room = min(room, self.segmentBytes - self.written)
+            try:
+                self.process.stdin.write(data[:room])
+            except (IOError, OSError) as err:
+                raise ExecuteError(self.command, err.strerror)
+            self.written += room
+            data = data[room:]
+            if self.segmentBytes and self.written >= self.segmentBytes:
+                self.finish()
+
+    def finish(self):
+        if not self.process:
+            return
+        process, self.process = self.process, None
+        process.stdin.close()
+        status = reap(process)
+        if status:
+            raise ExecuteError(self.command, "unexpected exit status (%d)" % status)
+        if self.segmentBytes:
+            os.rename(self.partial, self.current)
+            with open(self.playlist, 'a') as playlist:
+                playlist.write(os.path.basename(self.current) + '\n')
+                playlist.flush()
+                os.fsync(playlist.fileno())
+
+    def abort(self):
+        if self.process:
+            self.process.stdin.close()
+            reap(self.process)
+            self.process = None
+
+class FileOutput(object):
+    """
+    Writes the audio to a file as is. Used for raw intermediates.
+    """
+    def __init__(self, filename):
+        self.filename = self.path = filename
+        self.file = None
+
+    def start(self):
+        self.file = open(self.filename, 'wb')
+
+    def write(self, data):
+        if not self.file:
+            self.start()
+        self.file.write(data)
+
+    def finish(self):
+        if self.file:
+            self.file.close()
+
+    abort = finish
+
+# Gate {{{1
+GateBlock = 441*4 # bytes read at a time from arecord while gated (10ms)
+
+class Gate(object):
+    """
+    Discards the 44.1kHz stereo audio captured before start (seconds since the
+    epoch). Call it with each block read from the recorder; it returns the
+    part of the block captured at or after start. The time at which each
+    sample was captured is estimated from the time at which the blocks
+    arrive: a block can only arrive after its last sample was captured, so
+    the earliest time consistent with every arrival is taken as the time of
+    the first sample of the stream. Read small blocks while gated so that
+    the estimate is refined with every period delivered by ALSA.
+    """
+    def __init__(self, start, rate=44100, frameBytes=4):
+        self.start = start
+        self.frameBytes = frameBytes
+        self.bytesPerSecond = rate*frameBytes
+        self.origin = None # estimated time the stream began
+        self.received = 0
+        self.open = False
+        self.first = None # estimated time the first sample passed was captured
+        self.error = None # first less start, in seconds
+
+    def __call__(self, data):
+        now = time.time()
+        self.arrived(len(data), now)
+        if now < self.start:
+            return b''
+        # position in the stream of the first byte of this block
+        position = self.received - len(data)
+        skip = max(self.offset() - position, 0)
+        if skip >= len(data):
+            return b''
+        self.opened(position + skip)
+        return data[skip:]
+
+    def arrived(self, size, now=None):
+        """
+        Note that size bytes arrived at now (the current time by default).
+        """
+        now = now or time.time()
+        self.received += size
+        origin = now - self.received/float(self.bytesPerSecond)
+        self.origin = origin if self.origin is None else min(self.origin, origin)
+
+    def offset(self):
+        """
+        Return the position in the stream of the first frame captured at or
+        after start.
+        """
+        offset = int((self.start - self.origin)*self.bytesPerSecond)
+        return offset - offset % self.frameBytes
+
+    def opened(self, position):
+        """
+        Note that the audio passed begins at position in the stream.
+        """
+        self.open = True
+        self.first = self.origin + position/float(self.bytesPerSecond)
+        self.error = self.first - self.start
+
+# Pipe the recorder into the encoder {{{1
+class LengthTimer(threading.Thread):
+    """
+    Terminates the recorder once the recording reaches its length. The length
+    may be extended while the timer waits (see extend()), in which case it
+    waits again. Call cancel() before the recorder is reaped.
+    """
+    def __init__(self, process, length):
+        threading.Thread.__init__(self, name='length')
+        self.daemon = True
+        self.process = process
+        self.length = length
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.expired = False
+
+    def run(self):
+        while not self.cancelled:
+            end = self.length.end()
+            if time.time() < end:
+                sleepUntil(end)
+                continue
+            with self.lock:
+                if not self.cancelled and self.process.returncode is None:
+                    self.expired = True
+                    self.process.terminate()
+            return
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+
+def skipToStart(source, gate):
+    """
+    Read and discard the audio the recorder captured before the start of the
+    gate, leaving the rest in the pipe to be read by the encoder. Until the
+    start only the audio already waiting is read, so none captured after the
+    start is taken.
+    """
+    fd = source.stdout.fileno()
+    while time.time() < gate.start:
+        if select.select([fd], [], [], gate.start - time.time())[0]:
+            data = os.read(fd, GateBlock)
+            if not data:
+                return
+            gate.arrived(len(data))
+    if gate.origin is None:
+        # nothing has arrived yet, the recording begins with the first audio
+        select.select([fd], [], [])
+        gate.origin = time.time()
+    skip = max(gate.offset() - gate.received, 0)
+    while skip:
+        data = os.read(fd, min(skip, BlockSize))
+        if not data:
+            return
+        skip -= len(data)
+        gate.arrived(len(data))
+    gate.opened(gate.received)
+
+def pipeGame(game, team, fin, filename, length, meter=None, start=None):
+    """
+    Record the game by connecting arecord directly to the encoder (see
+    Pipeline), so the audio does not pass through Python. Arecord is
+    terminated once the game reaches length, which may grow as it records (see
+    LengthTimer). If start is given, arecord is started right away, the audio
+    it captures before start is discarded, and the encoder is then connected
+    to it. If meter is given, the overruns and the growth of the file are
+    watched.
+    """
+    from subprocess import PIPE
+    recorder = buildRecorder(fin)
+    encoder = buildEncoder(game, team, filename)
+    errors = None
+    if meter:
+        # the audio is not seen, so a capture that stalls is only noticed
+        # when the file stops growing
+        meter.counted = False
+        meter.output = Info(path=filename)
+        read, errors = os.pipe()
+        health.watchErrors(os.fdopen(read, 'rb'), meter.xrun)
+    source = None
+    timer = None
+    try:
+        if start:
+            source = spawn(recorder, stdout=PIPE, stderr=errors)
+            timer = LengthTimer(source, length)
+            timer.start()
+            gate = Gate(start)
+            skipToStart(source, gate)
+            pipeline = Pipeline(
+                [encoder], stdin=source.stdout, stderr=errors
+            ).start()
+            source.stdout.close()
+            if gate.open:
+                print 'Recording began %+.1f ms from its scheduled start.' % (
+                    1000*gate.error
+                )
+            if meter and gate.open:
+                timing.event('first audio', when=gate.first, error=gate.error)
+        else:
+            pipeline = Pipeline([recorder, encoder], stderr=errors).start()
+            timer = LengthTimer(pipeline.processes[0], length)
+            timer.start()
+    except:
+        if timer:
+            timer.cancel()
+        if source:
+            source.kill()
+            reap(source)
+        raise
+    finally:
+        if errors is not None:
+            os.close(errors)
+    try:
+        statuses = pipeline.wait(accept=True)
+        timer.cancel()
+        if source:
+            statuses = [reap(source)] + statuses
+    except:
+        timer.cancel()
+        pipeline.terminate()
+        if source:
+            source.kill()
+            reap(source)
+        raise
+    if meter and not start and pipeline.latencies[0] is not None:
+        timing.event(
+            'first audio', when=pipeline.started + pipeline.latencies[0]
+        )
+    if statuses[-1]:
+        raise ExecuteError(
+            encoder, "unexpected exit status (%d)" % statuses[-1]
+        )
+    if statuses[0] and not timer.expired:
+        raise ExecuteError(
+            recorder, "unexpected exit status (%d)" % statuses[0]
+        )
+
+# Capture in-process {{{1
+BlockSize = 44100*4 # bytes in each block read from arecord (1 second)
+
+def capture(
+    recorder, output, convert=None, length=None, meter=None, start=None
+):
+    """
+    Run the recorder and pass its output, converted if convert is given, to
+    output. If length is given, the recorder is stopped once it has produced
+    that much 44.1kHz stereo audio. If meter is given (see health.py), the
+    flow of audio and the overruns reported by the recorder are counted. If
+    start is given, the recorder and the encoder are started right away but
+    the audio captured before start is discarded (see Gate). Raises
+    ExecuteError if the recorder or the encoder fails.
+    """
+    from subprocess import PIPE
+    gate = Gate(start) if start else None
+    if meter:
+        source = spawn(recorder, stdout=PIPE, stderr=PIPE)
+        health.watchErrors(source.stderr, meter.xrun)
+        meter.bytesPerSecond = 4*44100
+        meter.output = output
+    else:
+        source = spawn(recorder, stdout=PIPE)
+    read = 0
+    stopped = False
+    try:
+        if gate:
+            output.start()
+        while True:
+            size = BlockSize if not gate or gate.open else GateBlock
+            if length:
+                size = min(size, length.bytes(44100, 4) - read)
+                if size <= 0:
+                    stopped = True
+                    source.terminate()
+                    break
+            data = source.stdout.read(size)
+            if not data:
+                break
+            if gate and not gate.open:
+                data = gate(data)
+                if not data:
+                    continue
+                print 'Recording began %+.1f ms from its scheduled start.' % (
+                    1000*gate.error
+                )
+            if not read and meter:
+                timing.event(
+                    'first audio', when=gate and gate.first,
+                    error=gate and gate.error
+                )
+            read += len(data)
+            if meter:
+                meter.read(len(data))
+                meter.write(output, convert(data) if convert else data)
+            else:
+                output.write(convert(data) if convert else data)
+        output.finish()
+    except:
+        source.kill()
+        output.abort()
+        raise
+    finally:
+        source.stdout.close()
+        status = reap(source)
+    if status and not stopped:
+        raise ExecuteError(recorder, "unexpected exit status (%d)" % status)
+
+def captureGame(
+    game, team, fin, filename, length, meter=None, start=None
+):
+    """
+    Record the game in-process, downmixing and resampling if Capture is 'dsp'
+    and splitting it into segments if SegmentLength is set. The fin is
+    recorded until the game reaches length, which may grow as it records. If
+    start is given, the recording begins at start, with the recorder and
+    encoder started ahead of it.
+    """
+    rate = EncoderRates[team.encoder] if Capture == 'dsp' else None
+    if rate:
+        from dsp import Converter
+        convert = Converter(rate).convert
+        bytesPerSecond = 2*rate
+    else:
+        convert = None
+        bytesPerSecond = 4*44100
+    output = Output(
+        lambda name: buildEncoder(game, team, name, rate)
+      , filename
+      , SegmentLength and int(SegmentLength*bytesPerSecond)
+    )
+    capture(buildRecorder(fin), output, convert, length, meter, start)
+
+def captureFromPreRoll(game, team, preroll, filename, length, meter=None):
+    """
+    Record the game from the fin's always-on capture (see preroll.py). The
+    audio held by the pre-roll buffer is placed at the front of the recording.
+    """
+    rate = preroll.rate
+    output = Output(
+        lambda name: buildEncoder(game, team, name, rate)
+      , filename
+      , SegmentLength and int(SegmentLength*2*rate)
+    )
+    feedFromPreRoll(preroll, output, length, meter)
+
+def feedFromPreRoll(preroll, output, length, meter=None):
+    """
+    Pass the audio from the pre-roll buffer, followed by live audio until the
+    recording reaches length, to output.
+    """
+    rate = preroll.rate
+    history, live = preroll.attach(meter)
+    write = meter.write if meter else lambda output, data: output.write(data)
+    if meter:
+        meter.bytesPerSecond = 2*rate
+        meter.output = output
+        # each block in the queue holds a second of audio (see BlockSize)
+        meter.backlog = lambda: live.qsize()*BlockSize/(4*44100.0)
+    try:
+        write(output, history)
+        timing.event('first audio', history=len(history)/(2.0*rate))
+        written = 0
+        while written < length.bytes(rate, 2):
+            data = live.get()
+            if data is None:
+                raise ExecuteError(preroll.command, "capture stopped")
+            if meter:
+                meter.read(len(data))
+            data = data[:length.bytes(rate, 2) - written]
+            write(output, data)
+            written += len(data)
+        output.finish()
+    except:
+        output.abort()
+        raise
+    finally:
+        preroll.detach()
+
+# Deferred encoding {{{1
+def deliveryFormats(team):
+    """
+    Return the formats into which a team's games are recorded. Games are only
+    recorded in more than one format (given by the optional formats field of
+    the team) when Capture is 'deferred'.
+    """
+    if Capture == 'deferred':
+        return getattr(team, 'formats', None) or [team.encoder]
+    return [team.encoder]
+
+def intermediateName(game, team):
+    audioDirectory = expandPath(team.audioDirectory)
+    return makePath(audioDirectory, '.'.join([game['filename'], Intermediate]))
+
+def captureIntermediate(
+    game, team, fin, filename, length, preroll=None, meter=None, start=None
+):
+    """
+    Record the game into an intermediate with as little work as possible
+    during the game: the audio is either written as is or compressed with
+    FLAC at its fastest setting. Returns the sample rate of the intermediate
+    if it is mono (from the pre-roll) or None if it is the stereo stream from
+    the fin.
+    """
+    rate = preroll.rate if preroll else None
+    if Intermediate == 'raw':
+        output = FileOutput(filename)
+    else:
+        output = Output(lambda name: buildIntermediate(name, rate), filename)
+    if preroll:
+        feedFromPreRoll(preroll, output, length, meter)
+    else:
+        capture(
+            buildRecorder(fin), output, length=length, meter=meter,
+            start=start
+        )
+    return rate
+
+def decodeIntermediate(intermediate):
+    """
+    Return the command (as a list of arguments) that writes the raw audio held
+    in an intermediate to its standard output.
+    """
+    if intermediate.endswith('.flac'):
+        return buildDecoder(intermediate)
+    return ['cat', intermediate]
+
+def findDeadAir(intermediate, rate=None):
+    """
+    Return the cut list that removes the dead air from an intermediate.
+    """
+    import silence
+    from subprocess import PIPE
+    command = decodeIntermediate(intermediate)
+    decoder = spawn(command, stdout=PIPE)
+    try:
+        cuts = silence.cutList(
+            decoder.stdout, rate or 44100, 1 if rate else 2
+        )
+    finally:
+        decoder.stdout.close()
+        status = reap(decoder)
+    if status:
+        raise ExecuteError(command, "unexpected exit status (%d)" % status)
+    return cuts
+
+def transcode(game, team, intermediate, rate=None):
+    """
+    Encode the intermediate into each of the team's delivery formats, running
+    up to Workers encoders at once. If TrimSilence is set, dead air is left
+    out. The intermediate is removed if all of the encoders succeed. Returns
+    the formats that could not be produced.
+    """
+    from multiprocessing.pool import ThreadPool
+    audioDirectory = expandPath(team.audioDirectory)
+    formats = deliveryFormats(team)
+    cuts = None
+    if TrimSilence:
+        try:
+            cuts = findDeadAir(intermediate, rate)
+            if cuts:
+                import silence
+                print 'Removing %.0f minutes of dead air from %s.' % (
+                    silence.removed(cuts)/60, game['desc']
+                )
+        except ExecuteError as err:
+            print '%s: %s' % (intermediate, err)
+
+    def encode(format):
+        # each thread of the pool drives its own decoder and encoder processes
+        filename = makePath(
+            audioDirectory, '.'.join([game['filename'], format])
+        )
+        formatTeam = Info(**dict(team.__dict__, encoder=format))
+        encoder = buildEncoder(game, formatTeam, filename, rate)
+        try:
+            if cuts:
+                from silence import Trimmer
+                capture(
+                    decodeIntermediate(intermediate)
+                  , Output(
+                        lambda name: buildEncoder(game, formatTeam, name, rate)
+                      , filename
+                    )
+                  , Trimmer(cuts, rate or 44100, 1 if rate else 2)
+                )
+            else:
+                Pipeline([decodeIntermediate(intermediate), encoder]).run()
+        except (ExecuteError, IOError, OSError) as err:
+            print '%s: %s' % (filename, err)
+            return format
+        return None
+
+    pool = ThreadPool(min(Workers or cpuCount(), len(formats)))
+    try:
+        failures = [format for format in pool.map(encode, formats) if format]
+    finally:
+        pool.close()
+        pool.join()
+    if not failures:
+        remove(intermediate, exitUponError=False)
+    return failures
+
+def cpuCount():
+    import multiprocessing
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+def finishDeferred(game, team, intermediate, rate, elapsed, complete):
+    """
+    Encode the game once it has been captured and add the results to the
+    index. Runs in the background so that the fin is free for the next game.
+    """
+    if not os.path.exists(intermediate):
+        return
+    print 'Encoding {desc} ({date}).'.format(**game)
+    with timing.span('encode', game=game['filename']):
+        failures = transcode(game, team, intermediate, rate)
+    audioDirectory = expandPath(team.audioDirectory)
+    for format in deliveryFormats(team):
+        if format not in failures:
+            indexRecording(
+                audioDirectory, game, Info(**dict(team.__dict__, encoder=format)),
+                elapsed, complete
+            )
+    if failures:
+        print 'Encoding failed for %s, kept %s.' % (
+            ', '.join(failures), intermediate
+        )
+    else:
+        print 'Encoding of {desc} ({date}) complete.'.format(**game)
+
+# Record a game {{{1
+def record(game, team, duration=None, preroll=None, start=None):
+    """
+    Record a game for a team using the team's fin. Blocks until the recording
+    is complete. Raises ExecuteError if any of the commands fail. The game is
+    recorded for duration hours if given, otherwise for as long as given by
+    recordingLength() (see schedule.py); either way the recording may be lengthened while it is
+    in progress with extend(). If preroll is given, the audio is taken from
+    that always-on capture of the fin rather than from a new arecord process.
+    If start is given, the fin is tuned and the destination prepared right
+    away, but the recording itself does not begin until start (seconds since
+    the epoch). Each step is timed (see timing.py).
+    """
+    with timing.span(
+        'record', game=game['filename'], team=team.name, fin=team.fin,
+        scheduled=start or game.get('start')
+    ):
+        recordGame(game, team, duration, preroll, start)
+
+def recordGame(game, team, duration, preroll, start):
+    fin = fins[team.fin]
+    length = Length(recordingLength(game, duration))
+    meter = health.Meter(game, team)
+    audioDirectory = expandPath(team.audioDirectory)
+    filename = makePath(
+        audioDirectory, '.'.join([game['filename'], team.encoder])
+    )
+    deferred = Capture == 'deferred'
+    if SegmentLength and not deferred:
+        # link to the playlist of the segments
+        latest = makePath(audioDirectory, 'latest.m3u')
+        target = makePath(audioDirectory, game['filename'] + '.m3u')
+    else:
+        latest = makePath(audioDirectory, 'latest.ogg')
+        target = filename
+
+    # assure destination directory exists and has room for the recording
+    with timing.span('mkdir'):
+        mkdir(audioDirectory)
+    # the intermediate of a deferred capture is removed once it is encoded,
+    # so it needs room on the disk but does not count against the budget
+    intermediate = retention.intermediateSize(
+        Intermediate, length.hours(), preroll.rate if preroll else None
+    ) if deferred else 0
+    with timing.span('make room'):
+        retention.prepare(
+            team, game, length.hours(), deliveryFormats(team), intermediate
+        )
+
+    # create a symbolic link to the latest game
+    with timing.span('link'):
+        remove(latest)
+        try:
+            os.symlink(target, latest)
+        except (IOError, OSError) as err:
+            sys.exit("%s: %s." % (err.filename, err.strerror))
+
+    # Configure the shark (set station, turn fin red to indicate recording)
+    with timing.span('tune', station=team.station):
+        tuneFin(fin, team.station)
+    began = None
+    complete = False
+    rate = None
+    # start the recorder and encoder ahead of the game and gate the audio,
+    # unless the audio comes from the pre-roll capture, which is already
+    # running
+    gate = start if start and PreSpawn and not preroll else None
+    try:
+        if start:
+            with timing.span('wait'):
+                sleepUntil(start - PreSpawn if gate else start)
+
+        # Record the game
+        print 'Recording {desc} ({date}) for %.1f hours.'.format(
+            **game
+        ) % length.hours()
+        timing.event('started')
+        began = max(time.time(), gate or 0)
+        length.start(gate)
+        recordings[team.name, game['filename']] = length
+        health.register(meter, began)
+        with timing.span('capture', capture=Capture, preroll=bool(preroll)):
+            if deferred:
+                rate = captureIntermediate(
+                    game, team, fin, intermediateName(game, team), length,
+                    preroll, meter, gate
+                )
+            elif preroll:
+                captureFromPreRoll(
+                    game, team, preroll, filename, length, meter
+                )
+            elif Capture == 'pipe' and not SegmentLength:
+                pipeGame(game, team, fin, filename, length, meter, gate)
+            else:
+                captureGame(
+                    game, team, fin, filename, length, meter, gate
+                )
+        complete = True
+        print 'Recording complete.'
+    finally:
+        recordings.pop((team.name, game['filename']), None)
+        health.unregister(meter)
+        # Turn the fin back to blue to indicate not recording
+        with timing.span('release'):
+            releaseFin(fin)
+        if began and deferred:
+            encoder = threading.Thread(
+                target=finishDeferred, args=(
+                    game, team, intermediateName(game, team), rate,
+                    time.time() - began, complete
+                ), name='encode %s' % game['filename']
+            )
+            encoder.start()
+        elif began:
+            with timing.span('index'):
+                indexRecording(
+                    audioDirectory, game, team, time.time() - began, complete
+                )
+
+# Index the recording {{{1
+def indexRecording(audioDirectory, game, team, elapsed, complete):
+    """
+    Add the recording to the index of the audio directory (see archive.py).
+    A failure to update the index does not affect the recording.
+    """
+    try:
+        archive.recorded(audioDirectory, game, team.encoder, elapsed, complete)
+    except (sqlite3.Error, IOError, OSError) as err:
+        print '%s: could not update index: %s.' % (audioDirectory, err)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# Keeps the recordings of each team within the limits given in teams.py by
+# deleting the oldest games. A team's budget limits the total size of its
+# recordings and its maxAge limits their age in days; either may be omitted.
+# Before each recording, the size of the recording is estimated from the bit
+# rate of the encoder and room is made for it, both within the budget and on
+# the disk, so that no files are deleted while the game is being captured.
+#
+# Usage:
+#     retention.py [--dry-run] [<team> ...]
+# Applies the limits to the given teams (all teams if none are given).
+
+# Imports {{{1
+from __future__ import division
+from fileutils import expandPath, getFilesRecursively, remove
+import archive
+import time
+import re
+import os
+
+# Globals {{{1
+# Approximate bit rates of the recordings made by each encoder (see
+# buildEncoder in recorder.py), used to estimate the size of a recording.
+EncoderBitRates = {
+    'ogg': 16000 # -q 0, 8kHz mono
+  , 'mp3': 16000 # -B16 caps the rate at 16kbps
+  , 'spx': 28000 # wideband at the default quality
+  , 'flac': 700000 # intermediate of deferred capture, 44.1kHz stereo
+  , 'raw': 1411200 # intermediate of deferred capture, 44.1kHz stereo
+}
+Margin = 1.25 # factor applied to the estimate to cover variation in bit rate
+Reserve = 100e6 # bytes of free space always to be left on the disk
+GameName = re.compile(
+    r'^(\d{6}-.*?)(?:-\d{3})?\.(?:%s|m3u|flac|raw)(?:\.part)?$' % (
+        '|'.join(archive.Encoders)
+    )
+)
+
+# Estimate {{{1
+def estimate(formats, duration):
+    """
+    Return the expected size in bytes of a recording of duration hours made
+    in each of the given formats.
+    """
+    return int(sum(
+        Margin*EncoderBitRates[format]*3600*duration/8 for format in formats
+    ))
+
+def intermediateSize(format, duration, rate=None):
+    """
+    Return the expected size in bytes of the intermediate of a deferred
+    capture of duration hours. Rate is the sample rate of a mono intermediate
+    taken from the pre-roll capture, or None for the stereo stream from the
+    fin.
+    """
+    bitRate = EncoderBitRates[format]
+    if rate:
+        bitRate = bitRate*rate/(2*44100)
+    return int(Margin*bitRate*3600*duration/8)
+
+def freeSpace(directory):
+    """
+    Return the number of bytes available on the disk that holds directory.
+    """
+    stat = os.statvfs(directory)
+    return stat.f_bavail*stat.f_frsize
+
+# Recordings {{{1
+def recordings(directory):
+    """
+    Return the games recorded in directory, oldest first. Each is given as a
+    tuple that contains the time of its most recent file, its total size, its
+    name (ex. '130401-Giants-at-Dodgers'), and the paths of its files
+    (recordings, segments and playlist). Files whose names are not those of
+    recordings are ignored.
+    """
+    games = {}
+    for entry in getFilesRecursively(
+        directory, rejectCriteria='.*', entries=True
+    ):
+        match = GameName.match(entry.name)
+        if not match or entry.is_symlink():
+            continue
+        stat = entry.stat()
+        mtime, size, paths = games.get(match.group(1), (0, 0, []))
+        games[match.group(1)] = (
+            max(mtime, stat.st_mtime), size + stat.st_size, paths + [entry.path]
+        )
+    return sorted(
+        (mtime, size, name, paths)
+        for name, (mtime, size, paths) in games.items()
+    )
+
+# Prune {{{1
+def prune(team, needed=0, keep=None, dryRun=False, now=None, temporary=0):
+    """
+    Delete the oldest games of a team until none are older than its maxAge
+    and, if needed bytes are to be added, until they fit both within its
+    budget and on the disk (unless even deleting every game would not make
+    room). Temporary bytes, such as the intermediate of a deferred capture,
+    are deleted after the game, so they need room on the disk but do not
+    count against the budget. The game named keep is never deleted. Returns
+    the names of the games deleted, the number of bytes still lacking on the
+    disk and the number of bytes by which the budget is still exceeded (both
+    zero if there is room for the needed bytes).
+    """
+    directory = expandPath(team.audioDirectory)
+    if not os.path.isdir(directory):
+        return [], 0, 0
+    budget = getattr(team, 'budget', None)
+    maxAge = getattr(team, 'maxAge', None)
+    now = now or time.time()
+    games = [game for game in recordings(directory) if game[2] != keep]
+    total = sum(size for mtime, size, name, paths in games)
+    free = freeSpace(directory)
+
+    # only delete games to make room if that can succeed; if the disk is
+    # filled by other files, or the recording alone exceeds the budget,
+    # deleting every recording would not help
+    spaceFixable = needed + temporary + Reserve - free <= total
+    budgetFixable = budget is not None and needed <= budget
+
+    def diskShort():
+        return max(needed + temporary + Reserve - free, 0)
+
+    def budgetOver():
+        return 0 if budget is None else max(total + needed - budget, 0)
+
+    removed = []
+    for mtime, size, name, paths in games:
+        tooOld = maxAge is not None and now - mtime > 86400*maxAge
+        if not (
+            tooOld or
+            spaceFixable and diskShort() or
+            budgetFixable and budgetOver()
+        ):
+            break
+        if not dryRun:
+            for path in paths:
+                remove(path, exitUponError=False)
+            archive.forget(directory, paths)
+        removed.append(name)
+        total -= size
+        free += size
+    return removed, diskShort(), budgetOver()
+
+def prepare(team, game, duration, formats=None, temporary=0):
+    """
+    Make room for a recording of game that lasts duration hours in each of the
+    given formats (the team's encoder by default), plus temporary bytes that
+    are only needed while the game is recorded and encoded. Called before the
+    recording starts so that no files are deleted while it is in progress.
+    """
+    needed = estimate(formats or [team.encoder], duration)
+    try:
+        removed, short, over = prune(
+            team, needed, keep=game['filename'], temporary=temporary
+        )
+    except (IOError, OSError) as err:
+        print '%s: could not make room for recording: %s.' % (
+            team.audioDirectory, err.strerror
+        )
+        return
+    for name in removed:
+        print 'Deleted %s to make room.' % name
+    budget = getattr(team, 'budget', None)
+    if budget is not None and needed > budget:
+        print 'Warning: %s: recording (%.0f MB) exceeds the budget (%.0f MB),' \
+            ' no games deleted for it.' % (
+                team.audioDirectory, needed/1e6, budget/1e6
+            )
+    elif over:
+        print 'Warning: %s: %.0f MB over the budget.' % (
+            team.audioDirectory, over/1e6
+        )
+    if short:
+        print 'Warning: %s: %.0f MB short of the space needed on the disk.' % (
+            team.audioDirectory, short/1e6
+        )
+
+# Main {{{1
+if __name__ == '__main__':
+    from teams import teams
+    import argparse
+    import sys
+    clp = argparse.ArgumentParser(description="Delete old recordings.")
+    clp.add_argument('--dry-run', '-n', help="only list the games that would be deleted", action='store_true')
+    clp.add_argument('teams', nargs='*', help="teams to prune (default is all)")
+    args = clp.parse_args()
+    for name in args.teams or sorted(teams):
+        if name not in teams:
+            sys.exit('%s: unknown team.' % name)
+        removed, short, over = prune(teams[name], dryRun=args.dry_run)
+        for game in removed:
+            print '%s: %s %s.' % (
+                teams[name].name, 'would delete' if args.dry_run else 'deleted',
+                game
+            )
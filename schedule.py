@@ -0,0 +1,370 @@
+# Reads the schedules for the teams and converts them into a Schedule. Each game
+# is represented as a dictionary that contains the following fields:
+#     desc: description of the game (ex. 'Giants at Dodgers')
+#     start: start time of the game in seconds since the epoch
+#     end: end time of the game in seconds since the epoch
+#     endKnown: whether end was given by the schedule (if not, end is start plus
+#         GameLength)
+#     filename: name of the recording without extension, unique within the
+#         schedule (a second game on the same day with the same description,
+#         such as the nightcap of a doubleheader, is given the suffix -2)
+#     date, day, time: start of game in human readable form
+#     media: the outlets that carry the game (may be empty)
+
+# Imports {{{1
+from array import array
+from bisect import bisect_left, bisect_right
+import csv
+import time
+import sys, os
+
+# Globals {{{1
+GameLength = 4*3600 # assumed length of a game in seconds
+RecordingDuration = 4.0 # hours recorded of games whose end is not scheduled
+Overrun = 1.0 # hours recorded past the scheduled end of a game (extra innings,
+              # overtime, post game show)
+
+# Parse CSV file {{{1
+def parseCsv(filename):
+    """
+    Read a CSV file downloaded from mlb.com and return the list of all of the
+    games it contains.
+    """
+    games = []
+    try:
+        with open(filename) as csvFile:
+            schedule = csv.DictReader(csvFile)
+            try:
+                for game in schedule:
+                    startDate = game['START_DATE']
+                    startTime = game['START_TIME']
+                    description = game['SUBJECT']
+                    media = game['DESCRIPTION']
+                    tstart = time.strptime(
+                        '%s;%s' % (startDate, startTime)
+                      , '%m/%d/%y;%I:%M %p'
+                    )
+                    start = time.mktime(tstart)
+                    date = time.strftime('%y%m%d', tstart)
+                    end = parseCsvEnd(game, start)
+                    games += [{
+                        'desc': description
+                      , 'start': int(start)
+                      , 'filename': '{date}-{desc}'.format(
+                            date = date
+                          , desc = description.replace(' ', '-')
+                        )
+                      , 'date': time.strftime("%0d %B %Y", tstart)
+                      , 'day': time.strftime("%A", tstart)
+                      , 'time': startTime
+                      , 'media': media
+                    }]
+                    if end:
+                        games[-1]['end'] = end
+            except csv.Error as err:
+                sys.exit('%s,%d: %s' % (filename, schedule.line_num, err))
+    except IOError as err:
+        sys.exit('%s: %s.' % (err.filename, err.strerror))
+    return games
+
+def parseCsvEnd(game, start):
+    """
+    Return the end time of a game from the END_DATE and END_TIME columns, or
+    None if they are missing, invalid, or not after the start.
+    """
+    endDate = game.get('END_DATE') or game['START_DATE']
+    endTime = game.get('END_TIME')
+    if not endTime:
+        return None
+    try:
+        end = int(time.mktime(time.strptime(
+            '%s;%s' % (endDate, endTime), '%m/%d/%y;%I:%M %p'
+        )))
+    except ValueError:
+        return None
+    return end if end > start else None
+
+# Parse ICS file {{{1
+def parseIcs(filename, timezone='US/Pacific'):
+    """
+    Read a vCalendar ICS file and return the list of all of the games it
+    contains.
+    """
+    from ics import readFile, IcsError
+    import pytz
+    import datetime
+    games = []
+    localTimeZone = pytz.timezone(timezone)
+    try:
+        for event in readFile(
+            filename, properties=('DTSTART', 'DTEND', 'SUMMARY'),
+            timezone=timezone
+        ):
+            start = datetime.datetime.fromtimestamp(
+                event['DTSTART'], localTimeZone
+            )
+            description = event.get('SUMMARY', '')
+            games += [{
+                'desc': description
+              , 'start': event['DTSTART']
+              , 'filename': '{year:02d}{month:02d}{day:02d}-{desc}'.format(
+                    desc = description.replace(' ', '-')
+                  , year = start.year%100
+                  , month = start.month
+                  , day = start.day
+                )
+              , 'date': start.strftime("%0d %B %Y")
+              , 'day': start.strftime("%A")
+              , 'time': start.strftime("%I:%M %p")
+              , 'media': ''
+            }]
+            if event.get('DTEND', 0) > event['DTSTART']:
+                games[-1]['end'] = event['DTEND']
+    except IcsError as err:
+        sys.exit(str(err))
+    except IOError as err:
+        sys.exit('%s: %s.' % (err.filename, err.strerror))
+    return games
+
+# Distinguish games {{{1
+def distinguish(games):
+    """
+    Give each game a distinct filename by adding -2, -3, ... to the names of
+    the later games that share a date and description with an earlier one.
+    The games are modified in place and returned.
+    """
+    used = set()
+    for game in sorted(games, key=lambda game: game['start']):
+        name = game['filename']
+        count = 1
+        while name in used:
+            count += 1
+            name = '%s-%d' % (game['filename'], count)
+        used.add(name)
+        game['filename'] = name
+    return games
+
+# Snapshots {{{1
+# Parsing a schedule is slow (particularly ICS files, which also require pytz),
+# so the parsed games are saved as compressed marshal data in a snapshot file
+# next to the schedule. The snapshot is used as long as the schedule has the
+# same contents, which is checked by comparing the modification time and size of
+# the schedule and, if they have changed (as they do every time the schedule is
+# downloaded again), the SHA1 hash of its contents.
+SnapshotVersion = 3
+
+def snapshotName(filename):
+    return filename + '.snapshot'
+
+def fileSignature(filename):
+    import hashlib
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def loadSnapshot(filename, key):
+    """
+    Return the games saved in the snapshot for filename if the snapshot is
+    current, otherwise return None.
+    """
+    import marshal, zlib
+    try:
+        stat = os.stat(filename)
+        with open(snapshotName(filename), 'rb') as f:
+            header, games = marshal.loads(zlib.decompress(f.read()))
+    except (IOError, OSError, EOFError, ValueError, TypeError, zlib.error):
+        return None
+    if header.get('key') != key:
+        return None
+    if (header['mtime'], header['size']) == (stat.st_mtime, stat.st_size):
+        return games
+    try:
+        if header['sha1'] != fileSignature(filename):
+            return None
+    except (IOError, OSError):
+        return None
+    # same contents but new modification time, refresh the snapshot
+    saveSnapshot(filename, key, games, header['sha1'])
+    return games
+
+def saveSnapshot(filename, key, games, sha1=None):
+    """
+    Save the games into the snapshot for filename. Failures are ignored, the
+    snapshot is only an optimization.
+    """
+    import marshal, zlib
+    snapshot = snapshotName(filename)
+    try:
+        stat = os.stat(filename)
+        header = {
+            'key': key
+          , 'mtime': stat.st_mtime
+          , 'size': stat.st_size
+          , 'sha1': sha1 or fileSignature(filename)
+        }
+        with open(snapshot + '.tmp', 'wb') as f:
+            f.write(zlib.compress(marshal.dumps((header, games)), 1))
+        os.rename(snapshot + '.tmp', snapshot)
+    except (IOError, OSError, ValueError):
+        pass
+
+def parseWithSnapshot(filename, parse, *args):
+    """
+    Return all of the games in a schedule, taken from its snapshot if it is
+    current, otherwise parsed with parse(filename, *args).
+    """
+    key = [SnapshotVersion, parse.__name__] + list(args)
+    games = loadSnapshot(filename, key)
+    if games is None:
+        games = parse(filename, *args)
+        saveSnapshot(filename, key, games)
+    return games
+
+def upcoming(games):
+    """
+    Return a Schedule that contains the games that have not yet started.
+    """
+    now = int(time.time())
+    return Schedule(game for game in games if game['start'] >= now)
+
+# Schedule {{{1
+class Schedule(object):
+    """
+    Holds a list of games in chronological order. The start and end times are
+    held in arrays and the rest of the fields in parallel lists of shared
+    strings, so large schedules take little memory. Queries by time use
+    bisection. Games are returned as dictionaries.
+    """
+    Fields = ('desc', 'filename', 'date', 'day', 'time', 'media')
+
+    def __init__(self, games=()):
+        games = sorted(games, key=lambda game: game['start'])
+        strings = {}
+        def share(string):
+            return strings.setdefault(string, string)
+        self.starts = array('d', (game['start'] for game in games))
+        self.ends = array('d', (
+            game.get('end', game['start'] + GameLength) for game in games
+        ))
+        self.endKnown = array('b', (
+            'end' in game and game.get('endKnown', True) for game in games
+        ))
+        self.columns = dict(
+            (field, [share(game.get(field, '')) for game in games])
+            for field in self.Fields
+        )
+        self.longest = max([
+            end - start for start, end in zip(self.starts, self.ends)
+        ] or [0])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        game = dict(
+            (field, self.columns[field][index]) for field in self.Fields
+        )
+        game['start'] = int(self.starts[index])
+        game['end'] = int(self.ends[index])
+        game['endKnown'] = bool(self.endKnown[index])
+        return game
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def nextGames(self, count=1, when=None):
+        """
+        Return the next count games that start after when (defaults to now).
+        """
+        if when is None:
+            when = time.time()
+        index = bisect_right(self.starts, when)
+        return [self[i] for i in range(index, min(index + count, len(self)))]
+
+    def nextGame(self, when=None):
+        """
+        Return the next game that starts after when (defaults to now), or None.
+        """
+        games = self.nextGames(1, when)
+        return games[0] if games else None
+
+    def between(self, begin, end):
+        """
+        Return the games that start at or after begin and before end.
+        """
+        return [
+            self[i] for i in range(
+                bisect_left(self.starts, begin), bisect_left(self.starts, end)
+            )
+        ]
+
+    def inProgress(self, when=None):
+        """
+        Return the games that are under way at when (defaults to now).
+        """
+        if when is None:
+            when = time.time()
+        # only games that started less than the longest game ago can be under way
+        first = bisect_right(self.starts, when - self.longest)
+        last = bisect_right(self.starts, when)
+        return [
+            self[i] for i in range(first, last) if self.ends[i] > when
+        ]
+
+# Read CSV file {{{1
+def readCsv(filename):
+    """
+    Read a CSV file downloaded from mlb.com and return a Schedule of the games
+    that have not yet started.
+    """
+    return upcoming(distinguish(parseWithSnapshot(filename, parseCsv)))
+
+# Read ICS file {{{1
+def readIcs(filename, timezone='US/Pacific'):
+    """
+    Read a vCalendar ICS file and return a Schedule of the games that have not
+    yet started.
+    """
+    return upcoming(
+        distinguish(parseWithSnapshot(filename, parseIcs, timezone))
+    )
+
+# Read schedule {{{1
+def readSchedule(filename):
+    """
+    Read a schedule, choosing the reader based on the file extension.
+    """
+    if filename.lower().endswith('.ics'):
+        return readIcs(filename)
+    return readCsv(filename)
+
+# Recording length {{{1
+def recordingLength(game, duration=None):
+    """
+    Return the number of hours to record a game: duration if given, otherwise
+    the scheduled length of the game plus Overrun if the schedule gives its
+    end, otherwise RecordingDuration.
+    """
+    if duration:
+        return duration
+    if game.get('endKnown', 'end' in game):
+        return (game['end'] - game['start'])/3600.0 + Overrun
+    return RecordingDuration
+
+# Announce next game {{{1
+def announceNextGame(team, nextGame):
+    """
+    Print a description of the next game for a team.
+    """
+    if nextGame:
+        print 'Next up for the %s:' % team.name
+        print '    {desc}'.format(**nextGame)
+        print '    {day}, {date}, {time}'.format(**nextGame)
+        if nextGame['media']:
+            print '    {media}'.format(**nextGame)
+    else:
+        print 'No more %s games scheduled.' % team.name
@@ -0,0 +1,341 @@
+#!/bin/env python
+# The program acts like a daemon that reads the schedules for all of the teams
+# listed on the command line. It then goes to sleep until the start of the next
+# game. At that time it wakes up and hands the game to the fin assigned to it
+# (see allocate.py), normally the team's own fin, but another fin if that one
+# is needed for an overlapping game. Each fin has its own worker thread, so a
+# game that runs long on one fin never delays the start of a recording on
+# another.
+
+# Imports {{{1
+from fins import fins, Info
+from teams import teams
+from schedule import readSchedule, announceNextGame
+import schedule
+from recorder import record, releaseFin, EncoderRates
+import recorder
+from verifaddrs import verifAddrs
+from fileutils import execute, ExecuteError, terminateChildren, expandPath
+import argparse
+import threading
+import Queue
+from clock import Scheduler
+from allocate import allocate, choose, compatible, describeConflict, window
+import fileutils
+import health
+import timing
+import traceback
+import signal
+import time
+import sys
+
+# Read command line {{{1
+clp = argparse.ArgumentParser(description="Multi-fin recording daemon")
+clp.add_argument('schedules', nargs='+', metavar='team=schedule', help="team name (from teams.py) and its schedule as CSV or ICS file", action='store')
+clp.add_argument('--duration', '-d', nargs=1, help="duration of recording in hours (by default each game is recorded until its scheduled end plus the overrun)", action='store')
+clp.add_argument('--overrun', '-o', nargs=1, help="hours to record past the scheduled end of a game", action='store')
+clp.add_argument('--capture', choices=['pipe', 'dsp', 'deferred'], help="pipe raw audio into the encoder, downmix and resample it in-process, or capture it losslessly and encode it after the game", action='store')
+clp.add_argument('--trim-silence', '-t', help="leave long stretches of dead air out of recordings encoded after the game (with --capture deferred)", action='store_true')
+clp.add_argument('--segment', '-s', nargs=1, help="split recordings into segments of this many minutes", action='store')
+clp.add_argument('--preroll', '-p', nargs=1, help="continuously capture each fin and start recordings with this many minutes of the audio that preceded the game", action='store')
+clp.add_argument('--warm-up', '-w', nargs=1, help="seconds before the start of a game to tune the fin and prepare the recording", action='store')
+clp.add_argument('--no-watch', help="do not reload the schedules when they change", action='store_true')
+clp.add_argument('--metrics', '-m', nargs=1, help="write the health of the recordings in progress to this file in the Prometheus text format", action='store')
+clp.add_argument('--timing-log', nargs=1, default=[timing.DefaultLog], help="append the time taken by each step of each recording to this file (default %s)" % timing.DefaultLog, action='store')
+clp.add_argument('--fixed-fins', '-f', help="record the games of each team only on its own fin", action='store_true')
+clp.add_argument('--discover', help="find the addresses of the fins automatically before starting (see discover.py)", action='store_true')
+clp.add_argument('--check-addrs', '-c', help="check the addresses used to access the fins", action='store_true')
+args = clp.parse_args()
+Duration = None
+if args.duration:
+    Duration = float(args.duration[0])
+if args.overrun:
+    schedule.Overrun = float(args.overrun[0])
+timing.Log = expandPath(args.timing_log[0])
+fileutils.trace = timing.span
+if args.capture:
+    recorder.Capture = args.capture
+if args.trim_silence:
+    recorder.TrimSilence = True
+if args.segment:
+    recorder.SegmentLength = 60*float(args.segment[0])
+if args.warm_up:
+    recorder.WarmUp = float(args.warm_up[0])
+
+# Read schedules {{{1
+schedules = {}
+filenames = {}
+for each in args.schedules:
+    try:
+        teamName, filename = each.split('=', 1)
+        team = teams[teamName]
+    except (ValueError, KeyError):
+        sys.exit('%s: expected team=schedule where team is one of: %s.' % (
+            each, ', '.join(sorted(teams))
+        ))
+    if team.fin not in fins:
+        sys.exit('%s: unknown fin (%s).' % (teamName, team.fin))
+    schedules[teamName] = readSchedule(filename)
+    filenames[teamName] = filename
+
+# Fin workers {{{1
+class FinWorker(threading.Thread):
+    """
+    Records the games assigned to one fin, one at a time, in the order they
+    are submitted.
+    """
+    def __init__(self, finName):
+        threading.Thread.__init__(self, name=finName)
+        self.daemon = True
+        self.finName = finName
+        self.queue = Queue.Queue()
+        self.busy = False
+        self.until = None # when the game being recorded is expected to end
+        self.preroll = None
+
+    def idle(self):
+        return not self.busy and self.queue.empty()
+
+    def submit(self, game, teamName):
+        self.queue.put((game, teamName))
+
+    def finish(self):
+        self.queue.put(None)
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            game, teamName = job
+            # the team as it is recorded on this fin
+            team = Info(**dict(teams[teamName].__dict__, fin=self.finName))
+            self.busy = True
+            self.until = window(game, Duration)[1]
+            try:
+                record(
+                    game, team, Duration, self.preroll, game['start']
+                )
+            except ExecuteError as err:
+                print '%s: %s' % (self.finName, err)
+            except SystemExit as err:
+                print '%s: %s' % (self.finName, err)
+            except Exception:
+                # keep the fin in service for the games that follow
+                print '%s: unexpected error while recording %s:' % (
+                    self.finName, game['desc']
+                )
+                traceback.print_exc()
+            finally:
+                self.busy = False
+                dispatched.discard((teamName,) + gameKey(game))
+            announceNextGame(team, schedules[teamName].nextGame())
+
+workers = {}
+if args.fixed_fins:
+    finNames = set(teams[teamName].fin for teamName in schedules)
+else:
+    finNames = fins
+for finName in finNames:
+    workers[finName] = FinWorker(finName)
+
+# Find the addresses of the fins {{{1
+if args.discover:
+    from discover import discoverFins
+    if not discoverFins(write=True):
+        print 'Warning: fins that were not matched keep their configured addresses.'
+
+# Verify the addresses to the fins {{{1
+if args.check_addrs:
+    for finName in sorted(workers):
+        verifAddrs(finName)
+    execute('clear')
+
+# Start the pre-roll captures {{{1
+if args.preroll:
+    from preroll import PreRoll
+    for teamName in sorted(schedules):
+        team = teams[teamName]
+        worker = workers[team.fin]
+        if not worker.preroll:
+            # the fin is kept tuned to the station of the first team that uses it
+            worker.preroll = PreRoll(
+                fins[team.fin], team.station, EncoderRates[team.encoder],
+                float(args.preroll[0])
+            )
+            worker.preroll.start()
+
+# Schedule all of the games {{{1
+# pending holds the scheduler events of the games that have not yet started,
+# indexed by team and then by (desc, start)
+pending = dict((teamName, {}) for teamName in schedules)
+
+def gameKey(game):
+    return (game['desc'], game['start'])
+
+# dispatched holds the games that have been handed to their fins but have not
+# yet finished, indexed by (team, desc, start); they are handed over early, so
+# they are still upcoming when a schedule is reloaded and must not be
+# scheduled again
+dispatched = set()
+
+# assignments gives the fin assigned to each game that has not yet started,
+# indexed by (team, desc, start)
+assignments = {}
+
+def tunedFins():
+    # fins with a pre-roll capture are kept tuned to one station
+    return dict(
+        (finName, worker.preroll.station)
+        for finName, worker in workers.items() if worker.preroll
+    )
+
+def plan():
+    # assign the games that have not yet started to fins, allowing for the
+    # games being recorded, and report the games that cannot be recorded
+    games = [
+        ((teamName,) + gameKey(game), game, teams[teamName])
+        for teamName in sorted(schedules)
+        for game in schedules[teamName]
+        if gameKey(game) in pending[teamName]
+    ]
+    busy = dict(
+        (finName, worker.until) for finName, worker in workers.items()
+        if worker.busy and worker.until
+    )
+    assigned, conflicts = allocate(
+        games, workers, tunedFins(), busy, args.fixed_fins, Duration
+    )
+    assignments.clear()
+    assignments.update(assigned)
+    for key, game, team, blockers in conflicts:
+        print describeConflict(game, team, blockers)
+
+def dispatch(game, teamName):
+    pending[teamName].pop(gameKey(game), None)
+    dispatched.add((teamName,) + gameKey(game))
+    team = teams[teamName]
+    finName = assignments.pop((teamName,) + gameKey(game), None)
+    if not finName or not workers[finName].idle():
+        # the plan is out of date (a game ran long), use any free fin
+        free = [
+            name for name, worker in workers.items()
+            if worker.idle() and
+            compatible(name, team, tunedFins(), args.fixed_fins)
+        ]
+        finName = choose(free, team) if free else finName or team.fin
+    if finName != team.fin:
+        print '%s will be recorded on the %s fin.' % (game['desc'], finName)
+    worker = workers[finName]
+    if worker.busy:
+        print '%s fin is busy, %s will start when it is free.' % (
+            worker.finName, game['desc']
+        )
+    worker.submit(game, teamName)
+
+def scheduleGame(game, teamName):
+    # the game is handed to its fin early so the fin can be warmed up
+    pending[teamName][gameKey(game)] = scheduler.enterabs(
+        game['start'] - recorder.WarmUp, 1, dispatch, (game, teamName)
+    )
+
+# Reload changed schedules {{{1
+# Only the games that were added, removed or moved are rescheduled. Games that
+# have already started (or are waiting for their fin) are not affected.
+def reload(filename):
+    for teamName in sorted(schedules):
+        if filenames[teamName] != filename:
+            continue
+        try:
+            games = readSchedule(filename)
+        except SystemExit as err:
+            print '%s: not reloaded: %s' % (filename, err)
+            continue
+        now = time.time()
+        old = pending[teamName]
+        new = dict((gameKey(game), game) for game in games)
+        removed = [
+            key for key in old if key not in new and key[1] > now
+        ]
+        added = [
+            key for key in new
+            if key not in old and (teamName,) + key not in dispatched
+        ]
+        for key in removed:
+            scheduler.cancel(old.pop(key))
+        for key in added:
+            scheduleGame(new[key], teamName)
+        schedules[teamName] = games
+        if not (removed or added):
+            continue
+        plan()
+        print '%s schedule changed:' % teams[teamName].name
+        moved = set(desc for desc, start in removed) & set(
+            desc for desc, start in added
+        )
+        for desc, start in sorted(removed, key=lambda key: key[1]):
+            if desc not in moved:
+                print '    cancelled: %s (%s)' % (desc, time.ctime(start))
+        for key in sorted(added, key=lambda key: key[1]):
+            verb = 'moved' if key[0] in moved else 'added'
+            print '    {verb}: {desc} ({day}, {date}, {time})'.format(
+                verb=verb, **new[key]
+            )
+        announceNextGame(teams[teamName], games.nextGame())
+
+def keepAlive():
+    # keeps the scheduler running while there are no games so that games
+    # added to the schedules later are still recorded
+    scheduler.enter(24*3600, 2, keepAlive, ())
+
+if args.no_watch:
+    scheduler = Scheduler()
+else:
+    from watch import Watcher
+    scheduler = Scheduler(Watcher(set(filenames.values()), reload))
+    keepAlive()
+for teamName, games in schedules.items():
+    for game in games:
+        scheduleGame(game, teamName)
+    announceNextGame(teams[teamName], games.nextGame())
+plan()
+
+# Extend recordings in progress {{{1
+# Sending SIGUSR1 (kill -USR1 <pid>) lengthens every recording in progress by
+# recorder.Extension minutes, for extra innings or overtime.
+def extendRecordings(signum, frame):
+    extended = recorder.extend()
+    if extended:
+        print 'Extended by %d minutes: %s.' % (
+            recorder.Extension, ', '.join(extended)
+        )
+    else:
+        print 'No recordings in progress to extend.'
+signal.signal(signal.SIGUSR1, extendRecordings)
+
+# Watch the recordings in progress {{{1
+# Warns within seconds when a capture stalls or an encoder falls behind.
+reporter = health.Reporter(args.metrics and expandPath(args.metrics[0]))
+reporter.start()
+
+for worker in workers.values():
+    worker.start()
+try:
+    scheduler.run()
+    for worker in workers.values():
+        worker.finish()
+    for worker in workers.values():
+        # join with a timeout so that KeyboardInterrupt is still delivered
+        while worker.is_alive():
+            worker.join(1)
+except KeyboardInterrupt:
+    for worker in workers.values():
+        if worker.preroll:
+            worker.preroll.stop()
+    terminateChildren()
+    for finName in workers:
+        try:
+            releaseFin(fins[finName])
+        except ExecuteError:
+            pass
+    print "Killed at user request."
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# Finds long stretches of dead air in a recording, such as rain delays and the
+# end of a recording that ran well past the end of the game. The audio is read
+# in blocks and the RMS level of each frame (one second by default) is found
+# with numpy, so memory use does not depend on the length of the recording.
+# Spans in which every frame is quieter than the threshold for at least
+# MinLength seconds are returned as a cut list, which Trimmer uses to remove
+# them from the audio as it streams past. Requires numpy.
+#
+# Usage:
+#     silence.py [--threshold <dB>] [--min-length <secs>] [--rate <hz>]
+#                [--channels <n>] <file>
+# Prints the cut list for a file of raw 16 bit audio ('-' for stdin). Other
+# formats can be piped in through their decoders, for example:
+#     flac -dcs --force-raw-format --endian=little --sign=signed game.flac |
+#         silence.py -
+#     oggdec -Q -R -o - game.ogg | silence.py --rate 8000 --channels 1 -
+
+# Imports {{{1
+from __future__ import division
+import numpy as np
+
+# Globals {{{1
+Threshold = -45 # dBFS, frames quieter than this are dead air
+MinLength = 300 # seconds, shorter quiet spans are left alone
+FrameLength = 1.0 # seconds over which the RMS level is measured
+Padding = 5 # seconds left at each side of a cut so speech is not clipped
+BlockSize = 1 << 20 # bytes read at a time
+
+# Find quiet spans {{{1
+class QuietFinder(object):
+    """
+    Finds the spans of at least minLength seconds in which the RMS level of
+    every frame is below threshold (in dBFS). Feed it raw 16 bit audio in
+    blocks of any size, then call finish() to get the spans as a list of
+    (start, end) pairs in seconds.
+    """
+    def __init__(
+        self, rate, channels, threshold=Threshold, minLength=MinLength,
+        frameLength=FrameLength
+    ):
+        self.frameLength = frameLength
+        self.minLength = minLength
+        self.frameValues = int(rate*frameLength)*channels
+        # compare mean squares to avoid taking square roots
+        self.limit = (32768*10**(threshold/20))**2
+        self.pending = b''
+        self.frames = 0
+        self.quietSince = None
+        self.spans = []
+
+    def feed(self, data):
+        data = self.pending + data
+        frameBytes = 2*self.frameValues
+        usable = len(data) - len(data) % frameBytes
+        self.pending = data[usable:]
+        if not usable:
+            return
+        samples = np.frombuffer(data[:usable], dtype='<i2').astype(np.float32)
+        samples = samples.reshape(-1, self.frameValues)
+        meanSquares = np.einsum('ij,ij->i', samples, samples)/self.frameValues
+        self.track(meanSquares < self.limit)
+
+    def track(self, quiet):
+        # find where quiet runs begin and end, carrying the state of the run
+        # in progress across blocks
+        state = np.concatenate(([self.quietSince is not None], quiet))
+        edges = np.diff(state.astype(np.int8))
+        for i in np.flatnonzero(edges):
+            if edges[i] > 0:
+                self.quietSince = self.frames + i
+            else:
+                self.close(self.frames + i)
+        self.frames += len(quiet)
+
+    def close(self, end):
+        start, self.quietSince = self.quietSince, None
+        if (end - start)*self.frameLength >= self.minLength:
+            self.spans.append((start*self.frameLength, end*self.frameLength))
+
+    def finish(self):
+        if self.quietSince is not None:
+            self.close(self.frames)
+        return self.spans
+
+    def duration(self):
+        return self.frames*self.frameLength
+
+def cutList(stream, rate, channels, **kwargs):
+    """
+    Read raw 16 bit audio from stream (a file object) and return the spans to
+    cut as (start, end) pairs in seconds. Padding is left at each side of a
+    span, except at the end of the recording (so even a recording that is all
+    dead air keeps its first few seconds). Keyword arguments are passed to
+    QuietFinder.
+    """
+    finder = QuietFinder(rate, channels, **kwargs)
+    while True:
+        data = stream.read(BlockSize)
+        if not data:
+            break
+        finder.feed(data)
+    end = finder.duration()
+    cuts = []
+    for start, stop in finder.finish():
+        start = start + Padding
+        stop = stop if stop >= end else stop - Padding
+        if stop > start:
+            cuts.append((start, stop))
+    return cuts
+
+# Trim {{{1
+class Trimmer(object):
+    """
+    Removes the spans given in a cut list from a stream of raw 16 bit audio.
+    Call it with each block of the stream in turn; it returns what remains of
+    the block.
+    """
+    def __init__(self, cuts, rate, channels):
+        frameBytes = 2*channels
+        self.cuts = [
+            (frameBytes*int(start*rate), frameBytes*int(stop*rate))
+            for start, stop in cuts
+        ]
+        self.offset = 0
+
+    def __call__(self, data):
+        begin = self.offset
+        end = begin + len(data)
+        self.offset = end
+        kept = []
+        position = begin
+        for start, stop in self.cuts:
+            if stop <= position or start >= end:
+                continue
+            if start > position:
+                kept.append(data[position - begin:start - begin])
+            position = stop
+        if position < end:
+            kept.append(data[position - begin:])
+        return b''.join(kept)
+
+def removed(cuts):
+    """
+    Return the total length of the spans in a cut list in seconds.
+    """
+    return sum(stop - start for start, stop in cuts)
+
+# Main {{{1
+if __name__ == '__main__':
+    import argparse
+    import sys
+    clp = argparse.ArgumentParser(description="Find dead air in a recording.")
+    clp.add_argument('--threshold', '-t', type=float, default=Threshold, help="level below which audio is dead air in dBFS (default %(default)s)", action='store')
+    clp.add_argument('--min-length', '-m', type=float, default=MinLength, help="shortest span of dead air to cut in seconds (default %(default)s)", action='store')
+    clp.add_argument('--rate', '-r', type=int, default=44100, help="sample rate (default %(default)s)", action='store')
+    clp.add_argument('--channels', '-c', type=int, default=2, help="number of channels (default %(default)s)", action='store')
+    clp.add_argument('file', help="raw 16 bit little endian audio, '-' for stdin")
+    args = clp.parse_args()
+    try:
+        stream = sys.stdin if args.file == '-' else open(args.file, 'rb')
+    except IOError as err:
+        sys.exit('%s: %s.' % (err.filename, err.strerror))
+    cuts = cutList(
+        getattr(stream, 'buffer', stream), args.rate, args.channels,
+        threshold=args.threshold, minLength=args.min_length
+    )
+    for start, stop in cuts:
+        print '%9.1f %9.1f' % (start, stop)
+    print '# %.1f minutes of dead air.' % (removed(cuts)/60)
@@ -0,0 +1,43 @@
+from fins import Info
+
+# The following describes each team whose games are to be recorded.
+# name:
+#     Name used when announcing games (ex. 'Giants').
+# artist:
+#     Used as the artist tag in the recordings (ex. 'The Giants').
+# station:
+#     The sharkctrl arguments used to tune the fin to the station that carries
+#     the games (ex. '-am 680' or '-fm 107.7').
+# audioDirectory:
+#     Directory into which the recordings are placed.
+# encoder:
+#     Format of the recordings, choose from 'ogg', 'mp3', 'spx'.
+# fin:
+#     Name of the fin (from fins.py) that is used to record the games.
+# formats (optional):
+#     List of formats into which the games are encoded after they are captured
+#     when using deferred capture (ex. ['ogg', 'mp3']). Defaults to encoder.
+# budget (optional):
+#     Largest total size in bytes of the recordings kept in audioDirectory
+#     (ex. 20e9). The oldest games are deleted to make room for new ones.
+# maxAge (optional):
+#     Games older than this many days are deleted (ex. 365).
+
+teams = {
+    'giants': Info(
+        name='Giants'
+      , artist='The Giants'
+      , station='-am 680'
+      , audioDirectory='~/music/giants'
+      , encoder='ogg'
+      , fin='baseball'
+    ),
+    '49ers': Info(
+        name='49ers'
+      , artist='The 49ers'
+      , station='-fm 107.7'
+      , audioDirectory='~/music/49ers'
+      , encoder='ogg'
+      , fin='football'
+    )
+}
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# Exercises allocate.py. Seasons are generated for several teams, with
+# doubleheaders, makeup games and games of different teams that overlap, and
+# assigned to a set of fins, some of which can only receive one band or are
+# kept tuned to one station. The assignments are checked: no fin records two
+# games at once, every game is on a fin that can receive it, a game is only
+# left out when every fin that could record it is in use, and teams keep their
+# own fins when they are free. The games of a doubleheader share their
+# description, as they do in the schedules, and must still be recorded under
+# different names. A large season checks that the time taken
+# grows no faster than n log n.
+
+from __future__ import division
+from fins import Info
+import allocate
+import schedule
+import tempfile
+import random
+import time
+import os
+
+allocate.fins = {
+    'baseball': Info(audioAddr='hw:2,0', ctrlAddr='0'),
+    'football': Info(audioAddr='hw:1,0', ctrlAddr='1'),
+    'spare': Info(audioAddr='hw:3,0', ctrlAddr='2'),
+    'fmonly': Info(audioAddr='hw:4,0', ctrlAddr='3', bands=['fm']),
+}
+Teams = {
+    'giants': Info(name='Giants', station='-am 680', fin='baseball'),
+    'as': Info(name='Athletics', station='-am 860', fin='baseball'),
+    '49ers': Info(name='49ers', station='-fm 107.7', fin='football'),
+    'warriors': Info(name='Warriors', station='-am 950', fin='football'),
+}
+
+def season(seed, games=200, start=1.4e9):
+    rng = random.Random(seed)
+    found = []
+    for teamName in sorted(Teams):
+        when = start + rng.uniform(0, 86400)
+        for i in range(games):
+            when += rng.choice([4, 24, 24, 48, 72])*3600
+            length = rng.uniform(2.5, 4)*3600
+            count = 2 if rng.random() < 0.05 else 1 # doubleheader
+            for j in range(count):
+                begin = int(when + j*length)
+                game = {
+                    'desc': '%s game %d' % (teamName, i),
+                    'start': begin, 'end': int(begin + length),
+                    'endKnown': rng.random() < 0.8,
+                }
+                found.append(((teamName, game['desc'], begin), game, Teams[teamName]))
+    return found
+
+def check(name, failures):
+    if not failures:
+        print 'pass: %s' % name
+        return 0
+    print 'FAIL: %s:' % name
+    for failure in failures[:5]:
+        print '    %s' % failure
+    return 1
+
+def verify(games, assigned, conflicts, tuned=None, pinned=False):
+    failures = 0
+    windows = dict((key, allocate.window(game)) for key, game, team in games)
+    byFin = {}
+    for key, finName in assigned.items():
+        byFin.setdefault(finName, []).append(windows[key])
+    overlaps = []
+    for finName, spans in byFin.items():
+        spans.sort()
+        overlaps += [
+            (finName, a, b) for a, b in zip(spans, spans[1:]) if b[0] < a[1]
+        ]
+    failures += check('no fin records two games at once', overlaps)
+    teamOf = dict((key, team) for key, game, team in games)
+    failures += check('every game on a compatible fin', [
+        key for key, finName in assigned.items()
+        if not allocate.compatible(finName, teamOf[key], tuned, pinned)
+    ])
+    # a conflict is only allowed if every compatible fin is in use
+    unjustified = []
+    for key, game, team, blockers in conflicts:
+        start = windows[key][0]
+        usable = [
+            finName for finName in allocate.fins
+            if allocate.compatible(finName, team, tuned, pinned)
+        ]
+        inUse = set(
+            finName for other, finName in assigned.items()
+            if windows[other][0] <= start < windows[other][1]
+        )
+        if not set(usable) <= inUse:
+            unjustified.append(key)
+    failures += check('conflicts only when every fin is in use', unjustified)
+    failures += check('every game assigned or reported', [
+        key for key, game, team in games
+        if key not in assigned and key not in [c[0] for c in conflicts]
+    ])
+    return failures
+
+failures = 0
+for seed in range(3):
+    games = season(seed)
+    assigned, conflicts = allocate.allocate(games)
+    print 'seed %d: %d games, %d assigned, %d conflicts' % (
+        seed, len(games), len(assigned), len(conflicts)
+    )
+    failures += verify(games, assigned, conflicts)
+    own = sum(
+        assigned.get(key) == team.fin for key, game, team in games
+    )
+    failures += check("most games on the team's own fin", (
+        [] if own > 0.5*len(games) else ['only %d of %d' % (own, len(games))]
+    ))
+
+# pre-roll keeps the baseball fin on the Giants station
+tuned = {'baseball': '-am 680'}
+games = season(7)
+assigned, conflicts = allocate.allocate(games, tuned=tuned)
+failures += verify(games, assigned, conflicts, tuned)
+
+# pinned: each team only on its own fin
+assigned, conflicts = allocate.allocate(games, pinned=True)
+failures += verify(games, assigned, conflicts, pinned=True)
+
+# a doubleheader on one fin: the second game moves to another fin
+opener = {'desc': 'opener', 'start': 1000000, 'end': 1010000, 'endKnown': True}
+nightcap = {'desc': 'nightcap', 'start': 1011000, 'end': 1021000, 'endKnown': True}
+games = [
+    ('g1', opener, Teams['giants']), ('g2', nightcap, Teams['giants'])
+]
+assigned, conflicts = allocate.allocate(games)
+failures += check('doubleheader on two fins', [] if (
+    assigned == {'g1': 'baseball', 'g2': 'football'} and not conflicts
+) else [assigned])
+
+# a fin that is busy recording is not used until it is free
+assigned, conflicts = allocate.allocate(
+    games, busy={'baseball': 1030000, 'football': 1030000, 'spare': 1030000}
+)
+failures += check('busy fins not used', [] if (
+    not assigned and len(conflicts) == 2
+) else [assigned, conflicts])
+
+# a doubleheader read from a schedule: both games have the same description,
+# but they are recorded on different fins under different names
+fd, path = tempfile.mkstemp(suffix='.csv')
+with os.fdopen(fd, 'w') as f:
+    f.write('\n'.join([
+        'START_DATE,START_TIME,END_DATE,END_TIME,SUBJECT,DESCRIPTION',
+        '12/01/37,01:05 PM,12/01/37,04:05 PM,Giants at Dodgers,KNBR',
+        '12/01/37,05:05 PM,12/01/37,08:05 PM,Giants at Dodgers,KNBR',
+        '12/02/37,01:05 PM,12/02/37,04:05 PM,Giants at Dodgers,KNBR',
+    ]) + '\n')
+try:
+    doubleheader = list(schedule.readCsv(path))
+finally:
+    os.remove(path)
+    if os.path.exists(schedule.snapshotName(path)):
+        os.remove(schedule.snapshotName(path))
+failures += check('doubleheader recorded under different names', [] if [
+    game['filename'] for game in doubleheader
+] == [
+    '371201-Giants-at-Dodgers', '371201-Giants-at-Dodgers-2',
+    '371202-Giants-at-Dodgers'
+] else [[game['filename'] for game in doubleheader]])
+named = [
+    (('giants', game['desc'], game['start']), game, Teams['giants'])
+    for game in doubleheader
+]
+assigned, conflicts = allocate.allocate(named)
+failures += check('doubleheader with one description on two fins', [] if (
+    len(set(assigned[key] for key, game, team in named[:2])) == 2
+    and not conflicts
+) else [assigned, conflicts])
+
+# scaling
+for size in [250, 2000]:
+    games = season(1, size)
+    began = time.time()
+    assigned, conflicts = allocate.allocate(games)
+    elapsed = time.time() - began
+    print '%d games assigned in %.3f s' % (len(games), elapsed)
+    if size == 250:
+        small = elapsed/len(games)
+    else:
+        failures += check('time grows no faster than n log n', [] if (
+            elapsed/len(games) < 4*small
+        ) else ['%.1f us per game vs %.1f' % (1e6*elapsed/len(games), 1e6*small)])
+
+if failures:
+    exit('%d checks failed.' % failures)
+print 'All checks passed.'
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# Exercises discover.py against synthetic fins. Each synthetic fin is wired to
+# one of the synthetic audio devices by a hidden, random permutation, and the
+# audio of a device is generated from the station its fin is tuned to: a
+# crude imitation of speech for AM and a wideband mixture of tones for FM,
+# each capture with its own content and level. Discovery must recover the
+# wiring for various numbers of fins, report a dead device rather than guess,
+# and find the capture devices in a fake /proc/asound tree.
+
+from __future__ import division
+from textwrap import dedent
+from dsp import testSignal
+import numpy as np
+import discover
+import tempfile
+import shutil
+import os
+
+discover.Settle = 0
+
+# Synthetic fins {{{1
+class Radio(object):
+    def __init__(self, count, seed, dead=()):
+        self.rng = np.random.RandomState(seed)
+        self.audioAddrs = ['hw:%d,0' % (i + 1) for i in range(count)]
+        self.ctrlAddrs = [str(i) for i in range(count)]
+        # wiring[ctrlAddr] is the index of the audio device fed by that fin
+        self.wiring = dict(zip(self.ctrlAddrs, self.rng.permutation(count)))
+        self.tuned = dict((ctrlAddr, None) for ctrlAddr in self.ctrlAddrs)
+        self.dead = dead
+
+    def tune(self, ctrlAddrs, stations):
+        for ctrlAddr, station in zip(ctrlAddrs, stations):
+            self.tuned[ctrlAddr] = station
+
+    def station(self, station, seconds):
+        if station.startswith('-am'):
+            audio = np.frombuffer(
+                testSignal(seconds, self.rng.randint(1 << 30)), dtype='<i2'
+            ).astype(float)
+        else:
+            t = np.arange(int(seconds*44100))/44100
+            tones = self.rng.uniform(200, 12000, 12)
+            audio = sum(np.sin(2*np.pi*f*t) for f in tones)*800
+            audio += 500*self.rng.randn(len(t))
+            audio = np.repeat(audio, 2)
+        audio *= self.rng.uniform(0.3, 1.5)
+        return np.clip(audio, -32768, 32767).astype('<i2').tobytes()
+
+    def capture(self, audioAddrs, seconds):
+        captures = [b''] * len(audioAddrs)
+        for ctrlAddr, device in self.wiring.items():
+            if audioAddrs[device] in self.dead:
+                captures[device] = b'\0' * int(4*44100*seconds)
+            else:
+                captures[device] = self.station(self.tuned[ctrlAddr], seconds)
+        return captures
+
+    def expected(self):
+        return dict(
+            (ctrlAddr, self.audioAddrs[device])
+            for ctrlAddr, device in self.wiring.items()
+        )
+
+def check(name, found, expected):
+    if found == expected:
+        print 'pass: %s' % name
+        return 0
+    print 'FAIL: %s:\n    expected: %r\n    found:    %r' % (name, expected, found)
+    return 1
+
+failures = 0
+
+# Patterns {{{1
+for count in range(1, 8):
+    steps = 2*discover.patterns(count) - 1
+    products = np.dot(steps, steps.T)
+    failures += check(
+        'patterns for %d fins are orthogonal' % count,
+        np.count_nonzero(products - np.diag(np.diag(products))), 0
+    )
+
+# Discovery {{{1
+for count in [1, 2, 3, 4, 6]:
+    for seed in range(3):
+        radio = Radio(count, seed)
+        mapping, score, problems = discover.discover(
+            radio.audioAddrs, radio.ctrlAddrs, tune=radio.tune,
+            capture=radio.capture
+        )
+        failures += check(
+            '%d fins, seed %d' % (count, seed), (mapping, problems),
+            (radio.expected(), [])
+        )
+
+radio = Radio(3, 0, dead=['hw:2,0'])
+mapping, score, problems = discover.discover(
+    radio.audioAddrs, radio.ctrlAddrs, tune=radio.tune, capture=radio.capture
+)
+expected = radio.expected()
+failures += check(
+    'dead device not matched', (sorted(mapping.values()), len(problems)),
+    (sorted(addr for addr in expected.values() if addr != 'hw:2,0'), 1)
+)
+
+# Find the capture devices {{{1
+root = tempfile.mkdtemp()
+try:
+    with open(os.path.join(root, 'cards'), 'w') as f:
+        f.write(dedent("""\
+             0 [PCH            ]: HDA-Intel - HDA Intel PCH
+                                  HDA Intel PCH at 0xf7f10000 irq 32
+             1 [RadioSHARK     ]: USB-Audio - RadioSHARK
+                                  Griffin Technology, Inc. RadioSHARK at usb-0000:00:14.0-4, full speed
+             2 [RadioSHARK_1   ]: USB-Audio - RadioSHARK
+                                  Griffin Technology, Inc. RadioSHARK at usb-0000:00:14.0-2, full speed
+        """))
+    for card, pcms in [(0, ['pcm0c', 'pcm0p']), (1, ['pcm0c']), (2, ['pcm0c'])]:
+        os.mkdir(os.path.join(root, 'card%d' % card))
+        for pcm in pcms:
+            os.mkdir(os.path.join(root, 'card%d' % card, pcm))
+    failures += check('find capture devices', discover.audioDevices(root), [
+        ('hw:1,0', 'usb-0000:00:14.0-4'), ('hw:2,0', 'usb-0000:00:14.0-2')
+    ])
+finally:
+    shutil.rmtree(root)
+
+if failures:
+    exit('%d checks failed.' % failures)
+print 'All checks passed.'
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# Exercises finctrl.py against fake hidraw devices. A fake sysfs tree is built
+# that contains two fins and an unrelated HID device, with ordinary files
+# standing in for the device nodes. The packets written to the files are then
+# compared with those expected.
+
+from fins import Info
+from textwrap import dedent
+import finctrl
+import tempfile
+import shutil
+import os
+import sys
+
+Devices = [
+    # name, HID_ID, HID_PHYS
+    ('hidraw0', '0003:0000046D:0000C52B', 'usb-0000:00:14.0-1/input0'),
+    ('hidraw1', '0003:0000077D:0000627A', 'usb-0000:00:14.0-4/input0'),
+    ('hidraw2', '0003:0000077D:0000627A', 'usb-0000:00:14.0-2/input0'),
+]
+
+def makeTree(root):
+    sysfs = os.path.join(root, 'sys')
+    dev = os.path.join(root, 'dev')
+    os.mkdir(dev)
+    for name, hidId, phys in Devices:
+        path = os.path.join(sysfs, name, 'device')
+        os.makedirs(path)
+        with open(os.path.join(path, 'uevent'), 'w') as f:
+            f.write(dedent("""\
+                DRIVER=hid-generic
+                HID_ID={}
+                HID_NAME=Griffin Technology, Inc. RadioSHARK
+                HID_PHYS={}
+            """).format(hidId, phys))
+        open(os.path.join(dev, name), 'w').close()
+    return sysfs, dev
+
+def packets(path):
+    with open(path, 'rb') as f:
+        data = bytearray(f.read())
+    size = finctrl.PacketLength + 1
+    return [list(data[i:i+size]) for i in range(0, len(data), size)]
+
+def check(name, found, expected):
+    if found == expected:
+        print 'pass: %s' % name
+        return 0
+    print 'FAIL: %s:\n    expected: %r\n    found:    %r' % (name, expected, found)
+    return 1
+
+root = tempfile.mkdtemp()
+failures = 0
+try:
+    sysfs, dev = makeTree(root)
+    devices = finctrl.findDevices(sysfs, dev)
+    failures += check(
+        'find devices', devices,
+        [os.path.join(dev, 'hidraw2'), os.path.join(dev, 'hidraw1')]
+    )
+
+    finctrl.findDevices = lambda: devices
+    shark = finctrl.control(Info(audioAddr='hw:1,0', ctrlAddr='1'))
+    failures += check('hidraw used', shark.kind, 'hidraw')
+    with shark.transaction():
+        shark.station('-am 680')
+        shark.blue(0)
+        shark.red(1)
+        failures += check('batched until end', packets(devices[1]), [])
+    shark.station('-fm 107.7')
+    shark.red(0)
+    failures += check('packets', packets(devices[1]), [
+        [0, 0xC0, 0x04, 0x6A, 0xF3, 0x36, 0, 0],   # 680 + 450
+        [0, 0xA0, 0x00, 0, 0, 0, 0, 0],
+        [0, 0xA9, 0, 0, 0, 0, 0, 0],
+        [0, 0xC0, 0x25, 0x03, 0x33, 0x04, 0, 0],   # (107700 + 10700)/12.5 + 3
+        [0, 0xA8, 0, 0, 0, 0, 0, 0],
+    ])
+    failures += check('other fin untouched', packets(devices[0]), [])
+    failures += check('latencies', len(shark.latencies), 5)
+    print shark.report()
+
+    fallback = finctrl.control(Info(audioAddr='hw:3,0', ctrlAddr='2'))
+    failures += check('fallback to sharkctrl', fallback.kind, 'sharkctrl')
+finally:
+    shutil.rmtree(root)
+sys.exit(1 if failures else 0)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# Checks that getFilesRecursively (fileutils.py) returns exactly the same files,
+# in the same order, as the original implementation based on os.walk and
+# fnmatch. A test hierarchy is generated that contains nested directories,
+# hidden files, names with glob characters, symbolic links to files and to
+# directories, and a broken link. Each combination of the accept, reject and
+# exclude criteria below is tried from several starting points.
+
+from fileutils import getFilesRecursively, getTail, makePath, splitPath
+from fnmatch import fnmatch
+import itertools
+import tempfile
+import shutil
+import os
+
+# Original implementation {{{1
+def reference(path, acceptCriteria = None, rejectCriteria = None, exclude = None):
+    if type(acceptCriteria) == str:
+        acceptCriteria = [acceptCriteria]
+    if type(rejectCriteria) == str:
+        rejectCriteria = [rejectCriteria]
+    def yieldFile(filename):
+        filename = getTail(filename)
+        if acceptCriteria != None:
+            if rejectCriteria != None:
+                for criterion in rejectCriteria:
+                    if fnmatch(filename, criterion):
+                        return False
+            for criterion in acceptCriteria:
+                if fnmatch(filename, criterion):
+                    return True
+            return False
+        else:
+            if rejectCriteria != None:
+                for criterion in rejectCriteria:
+                    if fnmatch(filename, criterion):
+                        return False
+            return True
+
+    def prepExcludes(exclude):
+        if not exclude:
+            return []
+        if type(exclude) == str:
+            exclude = [exclude]
+        excludes = []
+        for each in exclude:
+            excludes += [splitPath(each)]
+        return excludes
+
+    def skip(path, excludes):
+        for each in excludes:
+            if splitPath(path)[0:len(each)] == each:
+                return True
+        return False
+
+    if os.path.isfile(path):
+        if yieldFile(path):
+            yield path
+    else:
+        excludes = prepExcludes(exclude)
+        for path, subdirs, files in os.walk(path):
+            for file in files:
+                filename = makePath(path, file)
+                if skip(filename, excludes):
+                    continue
+                if yieldFile(filename):
+                    yield filename
+
+# Test hierarchy {{{1
+Files = [
+    'latest.ogg', 'latest.m3u', '.hidden.ogg', 'notes.txt',
+    '2013/130401-Giants-at-Dodgers.ogg', '2013/130401-Giants-at-Dodgers.m3u',
+    '2013/130402-Giants-at-Dodgers-001.ogg', '2013/[draft].ogg',
+    '2013/old/130101-test.ogg.part', '2013/old/deeper/x.mp3',
+    '2014/140330-Giants-at-Diamondbacks.mp3', '2014/README',
+    '2014/playoffs/141001-Giants-at-Pirates.spx',
+    'skip/me.ogg', 'skip/too/me.ogg',
+]
+Links = [
+    ('2014', 'link-to-dir'),
+    ('notes.txt', 'link-to-file.ogg'),
+    ('does-not-exist', 'broken.ogg'),
+]
+
+Accepts = [None, '*.ogg', ['*.ogg', '*.mp3'], ['[0-9]*'], ['*[[]*'], []]
+Rejects = [None, '*.m3u', ['.*', '*-001.*'], ['*']]
+Excludes = [
+    None, 'skip', ['skip', '2013/old'], '2014/README', '2013/old/', 'skip/too',
+    'archive', 'archive/skip', 'archive/2013', './archive/2013', 'nothing',
+]
+Starts = [
+    'archive', 'archive/', './archive', 'archive/2013', 'archive//2013',
+    'archive/latest.ogg', 'archive/missing',
+]
+
+def build(root):
+    for name in Files:
+        path = os.path.join(root, 'archive', name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(name)
+    for target, name in Links:
+        os.symlink(target, os.path.join(root, 'archive', name))
+
+# Compare {{{1
+root = tempfile.mkdtemp()
+cwd = os.getcwd()
+failures = checks = 0
+try:
+    build(root)
+    os.chdir(root)
+    for start, accept, reject, exclude in itertools.product(
+        Starts, Accepts, Rejects, Excludes
+    ):
+        expected = list(reference(start, accept, reject, exclude))
+        found = list(getFilesRecursively(start, accept, reject, exclude))
+        entries = [
+            entry.path for entry in getFilesRecursively(
+                start, accept, reject, exclude, entries=True
+            )
+        ]
+        checks += 1
+        if found != expected or entries != expected:
+            failures += 1
+            print 'MISMATCH: start=%r accept=%r reject=%r exclude=%r' % (
+                start, accept, reject, exclude
+            )
+            print '    expected:', expected
+            print '    found:   ', found
+            print '    entries: ', entries
+finally:
+    os.chdir(cwd)
+    shutil.rmtree(root)
+
+if failures:
+    exit('%d of %d checks failed.' % (failures, checks))
+print 'All %d checks passed.' % checks
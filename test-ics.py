@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# Compares the events found by the streaming ICS reader (ics.py) with those
+# found by vobject. With no arguments, a test calendar is generated that
+# contains folded lines, escaped text, alarms, and times given in UTC, with a
+# TZID, as floating times, and as dates. Otherwise each ICS file given on the
+# command line is compared.
+
+from __future__ import division
+from ics import readFile
+from textwrap import dedent
+import calendar
+import datetime
+import vobject
+import pytz
+import sys
+
+IcsFilename = 'test-ics.ics'
+TimeZone = 'US/Pacific'
+Events = 2000
+
+IcsHeader = dedent("""\
+    BEGIN:VCALENDAR
+    VERSION:2.0
+    PRODID:-//radioshark//test-ics//EN
+""")
+IcsEvents = [
+    dedent("""\
+        BEGIN:VEVENT
+        DTSTART:{utc}
+        DTEND:{utc}
+        SUMMARY:49ers at Packers {n}
+        UID:{n}a@test
+        END:VEVENT
+    """),
+    dedent("""\
+        BEGIN:VEVENT
+        DTSTART;TZID=America/New_York:{local}
+        SUMMARY:Giants at Mets\\, game {n} of a very long description that has
+          been folded onto a second line\; twice
+        UID:{n}b@test
+        BEGIN:VALARM
+        TRIGGER:-PT15M
+        SUMMARY:not the summary of the event
+        ACTION:DISPLAY
+        END:VALARM
+        END:VEVENT
+    """),
+    dedent("""\
+        BEGIN:VEVENT
+        DTSTART:{local}
+        SUMMARY:Floating time {n}
+        UID:{n}c@test
+        END:VEVENT
+    """),
+    dedent("""\
+        BEGIN:VEVENT
+        DTSTART;VALUE=DATE:{date}
+        SUMMARY:All day {n}
+        UID:{n}d@test
+        END:VEVENT
+    """),
+]
+IcsFooter = "END:VCALENDAR\n"
+
+def writeCalendar(filename):
+    base = datetime.datetime(2013, 1, 1)
+    with open(filename, 'w') as icsFile:
+        icsFile.write(IcsHeader)
+        for n in range(Events):
+            when = base + datetime.timedelta(hours=7*n)
+            icsFile.write(IcsEvents[n % len(IcsEvents)].format(
+                n=n,
+                utc=when.strftime('%Y%m%dT%H%M%SZ'),
+                local=when.strftime('%Y%m%dT%H%M%S'),
+                date=when.strftime('%Y%m%d'),
+            ))
+        icsFile.write(IcsFooter)
+
+def toTimestamp(value):
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = pytz.timezone(TimeZone).localize(value)
+    return calendar.timegm(value.utctimetuple())
+
+def vobjectEvents(filename):
+    with open(filename) as icsFile:
+        cal = vobject.readOne(icsFile.read())
+    for event in cal.vevent_list:
+        yield {
+            'DTSTART': toTimestamp(event.dtstart.value),
+            'SUMMARY': event.summary.value,
+        }
+
+def compare(filename):
+    expected = list(vobjectEvents(filename))
+    found = list(readFile(filename, timezone=TimeZone))
+    failures = 0
+    if len(expected) != len(found):
+        print '%s: found %d events, expected %d.' % (
+            filename, len(found), len(expected)
+        )
+        failures += 1
+    for theirs, ours in zip(expected, found):
+        if theirs != ours:
+            print '%s: mismatch:\n    expected: %r\n    found:    %r' % (
+                filename, theirs, ours
+            )
+            failures += 1
+    print '%s: %d events, %d failures.' % (filename, len(expected), failures)
+    return failures
+
+if __name__ == '__main__':
+    filenames = sys.argv[1:]
+    if not filenames:
+        writeCalendar(IcsFilename)
+        filenames = [IcsFilename]
+    failures = sum(compare(filename) for filename in filenames)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# Checks that pipe() and Stream (fileutils.py) drain the streams of a command
+# at the same time: a command that writes a large amount to stderr before it
+# writes to stdout, or that must be fed a large stdin while it writes, must not
+# deadlock. Also checks that a command that runs too long is stopped at its
+# timeout, that output beyond the limit is refused, and that output passed to
+# a callback arrives whole and in order. Finally checks that Pipeline connects
+# several stages, reports the exit status of each and the time each took to
+# produce its first output, and names the stage that fails.
+
+from fileutils import pipe, Stream, Pipeline, ExecuteError, ChunkSize
+import fileutils
+import tempfile
+import time
+import sys
+import os
+
+Python = sys.executable
+Big = 1 << 20 # well beyond the capacity of a pipe
+
+def python(program):
+    return '%s -c "%s"' % (Python, program)
+
+failures = 0
+def check(name, passed, detail=''):
+    global failures
+    if passed:
+        print 'pass: %s' % name
+    else:
+        failures += 1
+        print 'FAIL: %s%s' % (name, ': ' + str(detail) if detail else '')
+
+def raises(function, message):
+    try:
+        function()
+    except ExecuteError as err:
+        return message in str(err)
+    return False
+
+# heavy stderr before stdout {{{1
+command = python(
+    "import sys; sys.stderr.write('e'*%d); sys.stderr.flush(); "
+    "sys.stdout.write('done')" % Big
+)
+began = time.time()
+stream = Stream(command, timeout=20)
+stdout = b''.join(stream)
+check(
+    'stderr filled before stdout', stdout == b'done' and
+    len(stream.stderr) == Big and stream.status == 0,
+    (stdout[:20], len(stream.stderr), stream.status)
+)
+check('no deadlock', time.time() - began < 10, time.time() - began)
+
+# large stdin while writing stdout {{{1
+status, stdout = pipe('cat', 'x'*Big, timeout=20)
+check('stdin fed while stdout read', status == 0 and len(stdout) == Big)
+
+# timeout {{{1
+began = time.time()
+check(
+    'command stopped at timeout',
+    raises(lambda: pipe('sleep 10', timeout=0.5), 'timed out')
+)
+check('timeout is prompt', time.time() - began < 3, time.time() - began)
+
+# limit {{{1
+command = python("import sys; sys.stdout.write('o'*%d)" % Big)
+check(
+    'stdout beyond limit refused',
+    raises(lambda: pipe(command, limit=10000, timeout=20), 'exceeds')
+)
+command = python("import sys; sys.stderr.write('e'*%d)" % Big)
+check(
+    'stderr beyond limit refused',
+    raises(lambda: pipe(command, limit=10000, timeout=20), 'exceeds')
+)
+status, stdout = pipe('printf hello', limit=10000)
+check('output within limit accepted', (status, stdout) == (0, 'hello'))
+
+# callback {{{1
+lines = ['line %d' % i for i in range(20000)]
+command = python(
+    "import sys; "
+    "sys.stdout.write(''.join('line %d\\\\n' % i for i in range(20000)))"
+)
+chunks = []
+status, stdout = pipe(command, callback=chunks.append, limit=10000, timeout=20)
+received = b''.join(chunks).decode('utf-8')
+check(
+    'callback receives every line in order',
+    status == 0 and stdout == '' and received.splitlines() == lines,
+    (status, len(received))
+)
+check(
+    'callback receives whole chunks',
+    all(len(chunk) == ChunkSize for chunk in chunks[:-1]) and
+    0 < len(chunks[-1]) <= ChunkSize,
+    [len(chunk) for chunk in chunks[-3:]]
+)
+check('callback bypasses the limit on collected output', len(received) > 10000)
+
+# exit status {{{1
+check(
+    'unexpected status reported with stderr',
+    raises(lambda: pipe('echo oops >&2; exit 3'), 'oops')
+)
+status, stdout = pipe('exit 3', accept=(3,))
+check('accepted status returned', status == 3)
+
+# pipeline {{{1
+traces = []
+class Trace(object):
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        traces.append(self)
+    def __enter__(self):
+        return self
+    def __exit__(self, kind, value, traceback):
+        return False
+fileutils.trace = Trace
+
+with tempfile.TemporaryFile() as output:
+    pipeline = Pipeline([
+        ['printf', 'one\\ntwo\\nthree\\n'],
+        ['sh', '-c', 'sleep 0.5; tr a-z A-Z'],
+        ['sort'],
+    ], stdout=output)
+    statuses = pipeline.run()
+    output.seek(0)
+    check(
+        'stages connected', output.read() == b'ONE\nTHREE\nTWO\n'
+    )
+check('status of each stage', statuses == [0, 0, 0], statuses)
+latencies = pipeline.latencies
+check(
+    'latency of each stage that feeds a pipe',
+    latencies[0] is not None and latencies[0] < 0.5 and
+    latencies[1] is not None and latencies[1] >= 0.5 and latencies[2] is None,
+    latencies
+)
+pipelines = [trace for trace in traces if trace.name == 'pipeline']
+check(
+    'statuses and latencies traced',
+    pipelines and pipelines[-1].attributes['statuses'] == statuses and
+    pipelines[-1].attributes['latencies'] == latencies and
+    pipelines[-1].attributes['command'].startswith('printf'),
+    pipelines and pipelines[-1].attributes
+)
+
+pipeline = Pipeline([
+    ['printf', 'x'], ['sh', '-c', 'cat > /dev/null; exit 4'], ['cat'],
+], stdout=open(os.devnull, 'w'))
+try:
+    pipeline.run()
+    check('failing middle stage reported', False, 'no error')
+except ExecuteError as err:
+    check(
+        'failing middle stage reported',
+        str(err).startswith('sh:') and '(4)' in str(err), err
+    )
+check(
+    'status of the other stages', pipeline.statuses == [0, 4, 0],
+    pipeline.statuses
+)
+fileutils.trace = None
+
+if failures:
+    sys.exit('%d checks failed.' % failures)
+print 'All checks passed.'
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# Times the steps taken to start and run a recording. Each step is timed as a
+# span on the monotonic clock; moments of interest, such as the arrival of the
+# first audio, are noted as events. The most recent spans and events are kept
+# in memory in a ring of fixed size, and each is also appended to the log (if
+# Log is set) as a line of JSON. Spans and events inherit the game of the span
+# that encloses them, and events within a span that gives the scheduled start
+# of a game also record how late they are relative to it (the skew), so start
+# latency can be tracked across the season.
+#
+# Usage:
+#     timing.py [--phases] [<log>]
+# Summarizes the log (the default is Log below): the start skew of each game,
+# and with --phases the time taken by each step.
+
+# Imports {{{1
+from __future__ import division
+from clock import monotonic
+from collections import deque
+import threading
+import json
+import time
+import os
+
+# Globals {{{1
+Log = None # file to which spans and events are appended (None disables)
+DefaultLog = '~/.radioshark-timing.log' # log used by the daemons
+Capacity = 1000 # number of spans and events kept in memory
+Inherited = ('game', 'scheduled') # attributes passed on to nested spans
+
+ring = deque(maxlen=Capacity)
+lock = threading.Lock()
+local = threading.local()
+
+# Record {{{1
+def context():
+    """
+    Return the stack of spans open in this thread.
+    """
+    if not hasattr(local, 'stack'):
+        local.stack = []
+    return local.stack
+
+def inherit(attributes):
+    stack = context()
+    if stack:
+        parent = stack[-1]
+        for name in Inherited:
+            if name in parent.attributes:
+                attributes.setdefault(name, parent.attributes[name])
+    return attributes
+
+def log(entry):
+    """
+    Keep an entry in the ring and append it to the log.
+    """
+    with lock:
+        ring.append(entry)
+        if not Log:
+            return
+        try:
+            with open(Log, 'a') as f:
+                f.write(json.dumps(entry, sort_keys=True) + '\n')
+        except (IOError, OSError, TypeError, ValueError):
+            pass # timing must never interfere with a recording
+
+class span(object):
+    """
+    Time the enclosed block:
+        with span('tune', station='-am 680'):
+            tuneFin(fin, station)
+    Any keyword arguments are recorded with the span. If the block raises an
+    exception, it is recorded as the error of the span.
+    """
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        stack = context()
+        inherit(self.attributes)
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.wall = time.time()
+        self.began = monotonic()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        duration = monotonic() - self.began
+        stack = context()
+        if stack and stack[-1] is self:
+            stack.pop()
+        entry = dict(self.attributes)
+        entry.update(
+            kind='span', name=self.name, wall=self.wall, duration=duration,
+            thread=threading.current_thread().name
+        )
+        if self.parent:
+            entry['parent'] = self.parent
+        if kind:
+            entry['error'] = str(value) or kind.__name__
+        log(entry)
+        return False
+
+def event(name, when=None, **attributes):
+    """
+    Note a moment of interest that happens now, or at when (seconds since the
+    epoch) if given. If an enclosing span gives the scheduled start of the
+    game, the skew of the event from it is recorded.
+    """
+    attributes = inherit(attributes)
+    entry = dict(
+        (key, value) for key, value in attributes.items() if value is not None
+    )
+    entry.update(
+        kind='event', name=name, wall=when or time.time(),
+        thread=threading.current_thread().name
+    )
+    if attributes.get('scheduled'):
+        entry['skew'] = entry['wall'] - attributes['scheduled']
+    stack = context()
+    if stack:
+        entry['parent'] = stack[-1].name
+    log(entry)
+
+def recent(name=None):
+    """
+    Return the spans and events held in the ring, oldest first, optionally
+    only those with the given name.
+    """
+    with lock:
+        entries = list(ring)
+    return [entry for entry in entries if name is None or entry['name'] == name]
+
+# Summarize {{{1
+def readLog(path):
+    entries = []
+    with open(path) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                pass # partially written line
+    return entries
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction*len(values)), len(values) - 1)]
+
+def summarize(entries, phases=False):
+    """
+    Return the lines of a report on the entries of a log: the start skew of
+    each game, and if phases is true, statistics on the duration of each
+    span, grouped by name (and by command for the commands run).
+    """
+    lines = []
+    skews = [
+        entry for entry in entries
+        if entry['kind'] == 'event' and entry['name'] == 'first audio'
+        and 'skew' in entry
+    ]
+    if skews:
+        lines.append('Start skew (first audio relative to scheduled start):')
+        for entry in skews:
+            lines.append('    %-45s %s %+10.1f ms' % (
+                entry.get('game', '?'),
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['wall'])),
+                1000*entry['skew']
+            ))
+        values = [entry['skew'] for entry in skews]
+        lines.append(
+            '    median %+.1f ms, 90th percentile %+.1f ms, worst %+.1f ms' % (
+                1000*percentile(values, 0.5), 1000*percentile(values, 0.9),
+                1000*max(values)
+            )
+        )
+    if phases:
+        durations = {}
+        for entry in entries:
+            if entry['kind'] == 'span':
+                name = entry['name']
+                if 'command' in entry:
+                    name += ' ' + entry['command'].split()[0]
+                durations.setdefault(name, []).append(entry['duration'])
+        lines.append('Time taken by each step (seconds):')
+        lines.append('    %-30s %6s %10s %10s %10s' % (
+            'step', 'count', 'median', '90%', 'max'
+        ))
+        for name, values in sorted(durations.items()):
+            lines.append('    %-30s %6d %10.4f %10.4f %10.4f' % (
+                name, len(values), percentile(values, 0.5),
+                percentile(values, 0.9), max(values)
+            ))
+    return lines
+
+# Main {{{1
+if __name__ == '__main__':
+    from fileutils import expandPath
+    import argparse
+    import sys
+    clp = argparse.ArgumentParser(description="Summarize the timing log.")
+    clp.add_argument('--phases', '-p', help="also show the time taken by each step", action='store_true')
+    clp.add_argument('log', nargs='?', default=DefaultLog, help="timing log written by the daemon (default %(default)s)")
+    args = clp.parse_args()
+    path = expandPath(args.log)
+    try:
+        entries = readLog(path)
+    except IOError as err:
+        sys.exit('%s: %s.' % (path, err.strerror))
+    for line in summarize(entries, args.phases) or ['No games have started.']:
+        print line
@@ -2,19 +2,13 @@
 
 from fins import fins
 from fileutils import execute, ExecuteError
+from finctrl import control
 from textwrap import dedent, fill
 from time import sleep
-from itertools import product
 
 # Globals
-audioAddrs = []
-ctrlAddrs = []
 pipeline = "arecord -c 2 -f S16 -r 44100 -d 10 -D %s -t raw -q | aplay -c 2 -f S16 -r 44100 -t raw"
 
-for fin in fins.itervalues():
-    audioAddrs += [fin.audioAddr]
-    ctrlAddrs += [fin.ctrlAddr]
-
 def verifAddrs(finName):
     fin = fins[finName]
     audioAddr = fin.audioAddr
@@ -43,28 +37,30 @@ def verifAddrs(finName):
     """))
 
     try:
-        for audioAddr, ctrlAddr in product(audioAddrs, ctrlAddrs):
-            for addr in ctrlAddrs:
-                execute('sharkctrl -fm 97.7 %s' % addr)
+        for each in fins.itervalues():
+            control(each).station('-fm 97.7')
 
-        audioAddr = fin.audioAddr
-        ctrlAddr = fin.ctrlAddr
+        shark = control(fin)
         print "ctrl addr:", ctrlAddr
         print "audio addr:", audioAddr
         print "station: KNBR 680 AM"
-        execute('sharkctrl -am 680 %s' % ctrlAddr)
-        execute('sharkctrl -blue 0 %s' % ctrlAddr)
-        execute('sharkctrl -red 1 %s' % ctrlAddr)
+        with shark.transaction():
+            shark.station('-am 680')
+            shark.blue(0)
+            shark.red(1)
         execute(pipeline % audioAddr)
         print "station: KQED 88.5 FM"
-        execute('sharkctrl -fm 88.5 %s' % ctrlAddr)
-        execute('sharkctrl -blue 63 %s' % ctrlAddr)
-        execute('sharkctrl -red 1 %s' % ctrlAddr)
+        with shark.transaction():
+            shark.station('-fm 88.5')
+            shark.blue(63)
+            shark.red(1)
         execute(pipeline % audioAddr)
-        execute('sharkctrl -red 0 %s' % ctrlAddr)
-        execute('sharkctrl -blue 63 %s' % ctrlAddr)
+        with shark.transaction():
+            shark.red(0)
+            shark.blue(63)
+        print shark.report()
     except ExecuteError, err:
-        exit(err.text)
+        exit(str(err))
 
 if __name__ == "__main__":
     try:
@@ -76,8 +72,10 @@ if __name__ == "__main__":
         print "############"
         verifAddrs('baseball')
     except KeyboardInterrupt:
-        execute('sharkctrl -red 0 %s' % ctrlAddr)
-        execute('sharkctrl -blue 63 %s' % ctrlAddr)
+        for fin in fins.itervalues():
+            with control(fin).transaction() as shark:
+                shark.red(0)
+                shark.blue(63)
         print "Killed at user request."
     except ExecuteError, err:
-        exit(err.text)
+        exit(str(err))
@@ -0,0 +1,98 @@
+# Watches files for changes. Uses inotify where available (through ctypes, so
+# no extra packages are needed) and otherwise polls the files with stat.
+#
+# The watcher is driven by the scheduler (see clock.py), which waits on the
+# inotify file descriptor along with its timer and calls handle() when it
+# becomes readable (or every PollInterval seconds when inotify is not
+# available). The callback runs in the same thread as the scheduler and may
+# freely add and cancel events.
+
+# Imports {{{1
+import os
+
+# Globals {{{1
+PollInterval = 30 # seconds between checks when inotify is not available
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+# Signature {{{1
+def signature(filename):
+    """
+    Return a value that changes whenever the file is rewritten or replaced.
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+# Inotify {{{1
+def openInotify(directories):
+    """
+    Return an inotify file descriptor that reports files that are written and
+    closed or moved into the given directories, or None if inotify is not
+    available.
+    """
+    try:
+        import ctypes, ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    for directory in directories:
+        wd = libc.inotify_add_watch(
+            fd, directory.encode('utf-8'), IN_CLOSE_WRITE | IN_MOVED_TO
+        )
+        if wd < 0:
+            os.close(fd)
+            return None
+    return fd
+
+# Watcher {{{1
+class Watcher(object):
+    """
+    Calls callback(filename) when one of the watched files changes.
+    """
+    def __init__(self, filenames, callback):
+        self.callback = callback
+        self.signatures = dict(
+            (filename, signature(filename)) for filename in filenames
+        )
+        self.pending = {}
+        directories = set(
+            os.path.dirname(os.path.abspath(filename)) for filename in filenames
+        )
+        self.fd = openInotify(directories)
+
+    def check(self):
+        """
+        Call the callback for each file that has changed. When polling, a file
+        must have the same signature on two consecutive checks before it is
+        considered changed, so that files that are still being downloaded are
+        not read.
+        """
+        for filename, previous in self.signatures.items():
+            current = signature(filename)
+            if current == previous or current is None:
+                self.pending.pop(filename, None)
+                continue
+            if self.fd is None and self.pending.get(filename) != current:
+                self.pending[filename] = current
+                continue
+            self.pending.pop(filename, None)
+            self.signatures[filename] = current
+            self.callback(filename)
+
+    def handle(self):
+        """
+        Consume any pending inotify events and check the files.
+        """
+        if self.fd is not None:
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except OSError:
+                pass
+        self.check()